@@ -0,0 +1,142 @@
+import atexit
+import concurrent.futures
+import queue
+import threading
+
+from playwright.sync_api import sync_playwright
+
+from config import DEBUG
+from util.colors import PINK, RESET, WHITE
+
+CHROMIUM_ARGS = [
+    "--no-sandbox",  # Necessary for running as root in Docker
+    "--disable-setuid-sandbox",  # Necessary for running as root in Docker
+    "--disable-dev-shm-usage",  # Overcome limited resource problems
+    "--disable-gpu"  # Sometimes necessary in headless environments
+]
+
+
+class BrowserPool:
+    """
+    Warm headless Chromium browsers, so an evaluation only pays for a new browser context instead of starting the
+    Playwright driver and a browser.
+    Playwright's sync API only works on the thread that started it, so every browser is owned by a worker thread and
+    the pages are used through jobs submitted to the pool. Each job gets its own context (no cookies or storage leak
+    between evaluations). A browser is relaunched when it disconnected (crash) and after `max_uses` jobs.
+    """
+
+    def __init__(self, size: int, max_uses: int):
+        self.size = size
+        self.max_uses = max_uses
+
+        self._jobs = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _start_workers(self):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The browser pool is closed.")
+            for _ in range(self.size - len(self._workers)):
+                worker = threading.Thread(target=self._work, name=f"browser-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _launch(self, playwright):
+        browser = playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+        if DEBUG:
+            print(f"{WHITE}Launched pooled browser {browser.version}{RESET}")
+        return browser
+
+    @staticmethod
+    def _is_healthy(browser) -> bool:
+        try:
+            return browser.is_connected()
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_browser(browser):
+        try:
+            browser.close()
+        except Exception as e:
+            print(f"{PINK}Could not close pooled browser: {e}{RESET}")
+
+    def _work(self):
+        playwright, browser, uses = None, None, 0
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                function, future = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    if playwright is None:
+                        playwright = sync_playwright().start()
+                    if browser is not None and (uses >= self.max_uses or not self._is_healthy(browser)):
+                        self._close_browser(browser)
+                        browser = None
+                    if browser is None:
+                        browser, uses = self._launch(playwright), 0
+                    uses += 1
+
+                    context = browser.new_context()
+                    try:
+                        result = function(context.new_page())
+                    finally:
+                        context.close()
+                    future.set_result(result)
+                except Exception as e:
+                    future.set_exception(e)
+                    if browser is None and playwright is not None:
+                        # the browser could not be launched, start over with a fresh driver
+                        playwright.stop()
+                        playwright = None
+        finally:
+            if browser is not None:
+                self._close_browser(browser)
+            if playwright is not None:
+                playwright.stop()
+
+    def run(self, function, timeout: float = None):
+        """
+        Calls `function` with a fresh page of a pooled browser and returns its result.
+        The page must not be used after the function returned.
+        """
+        self._start_workers()
+        future = concurrent.futures.Future()
+        self._jobs.put((function, future))
+        return future.result(timeout=timeout)
+
+    def close(self, timeout: float = 10):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._jobs.put(None)
+        for worker in workers:
+            worker.join(timeout=timeout)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool(size: int, max_uses: int) -> BrowserPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(size, max_uses)
+        return _pool
+
+
+@atexit.register
+def close_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
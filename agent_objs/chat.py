@@ -1,9 +1,10 @@
 import os
 import sys
+import uuid
 from typing_extensions import override
 
 import config
-import util
+from agent_objs.chat_store import get_chat_store
 from llm_functions import count_context_length
 from util.colors import PINK, RESET
 
@@ -30,9 +31,18 @@ class Chat(list):
     def __init__(self, chat_name: str = None, agent_system_name:str = "Unknown", chat_dir: str = "projects"):
         self.chat_name = chat_name
         self.agent_system_name = agent_system_name
-        self.chat_file = os.path.join(chat_dir, f"{chat_name}.json")
+        self.chat_store = get_chat_store(chat_dir, chat_name)
+        self.chat_file = self.chat_store.get_file()
         super().__init__(self.restore_chat_history())
-        util.save_json(self.chat_file, self)
+        # message index -> (model, token count), kept out of the message records so the API does not serve them
+        self._message_tokens = self.restore_token_counts()
+        # changes whenever the chat is cleared, so cursors and ETags of an old history become invalid
+        self.generation = uuid.uuid4().hex[:12]
+
+        # index of the last message of every sender, so sender lookups do not scan the chat
+        self._last_index_of_sender = {}
+        for i, message in enumerate(self):
+            self._last_index_of_sender[message['sender']] = i
         pass
 
     def __str__(self):
@@ -40,14 +50,29 @@ class Chat(list):
 
     def restore_chat_history(self):
         try:
-            chat_history = util.load_json(self.chat_file)
-        except:
+            chat_history = self.chat_store.load()
+        except Exception as e:
+            print(f"{PINK}Error restoring chat `{self.chat_name}`: {e}{RESET}")
             chat_history = []
+        for message in chat_history:
+            # token counts were cached on the messages themselves before
+            message.pop("tokens", None)
+            message.pop("token_model", None)
         return chat_history
 
+    def restore_token_counts(self):
+        try:
+            return self.chat_store.load_token_counts()
+        except Exception as e:
+            print(f"{PINK}Error restoring the token counts of chat `{self.chat_name}`: {e}{RESET}")
+            return {}
+
     def clear(self):
-        util.delete_file(self.chat_file)
+        self.chat_store.clear()
         super().clear()
+        self._message_tokens = {}
+        self._last_index_of_sender = {}
+        self.generation = uuid.uuid4().hex[:12]
         pass
 
     def append_message(self, sender, text):
@@ -55,13 +80,17 @@ class Chat(list):
 
     def add_message(self, sender, text):
         print(f"Adding message to `{self.chat_name}` by `{sender}`")
-        self.append({"sender": sender, "text": text})
+        message = {"sender": sender, "text": text}
+        self.append(message)
         _notify(f"Adding message to `{self.chat_name}` of `{self.agent_system_name}`")
 
 
     def append(self, item):
         super().append(item)
-        util.save_json(self.chat_file, self)
+        index = len(self) - 1
+        tokens = self.get_message_tokens(index, persist=False)
+        self.chat_store.append(item, tokens=tokens, token_model=config.selected_model)
+        self._last_index_of_sender[item['sender']] = index
 
     def find(self, value):
         return [i for i, item in enumerate(self) if value in item]
@@ -69,26 +98,57 @@ class Chat(list):
     def get_chat_name(self):
         return self.chat_name
 
+    def get_etag(self):
+        """The chat is append-only, so its generation and length identify its state."""
+        return f"{self.generation}-{len(self)}"
+
+    def get_cursor(self, seq: int):
+        return f"{self.generation}:{seq}"
+
+    def parse_cursor(self, cursor: str):
+        """
+        Returns the seq encoded in the cursor, or None if the cursor belongs to an older generation of the chat
+        (i.e. the chat was cleared since) or is malformed.
+        """
+        try:
+            generation, seq = cursor.split(":", 1)
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+        if generation != self.generation or seq < 0 or seq > len(self):
+            return None
+        return seq
+
+    def get_messages(self, since: int = 0, limit: int = None):
+        """Returns the messages with seq >= `since` (at most `limit`), each annotated with its seq."""
+        since = max(0, since)
+        end = len(self) if limit is None else min(len(self), since + max(0, limit))
+        return [dict(self[seq], seq=seq) for seq in range(since, end)]
+
     def get_chat_file(self):
         return self.chat_file
 
     def get_last_message_of_sender(self, sender: str):
-        for message in reversed(self):
-            if message['sender'] == sender:
-                return message
-        return None
+        index = self._last_index_of_sender.get(sender)
+        if index is None:
+            return None
+        return self[index]
 
     def get_last_messages_of_sender(self, sender: str):
         if self.chat_name != "Clean Chat":
             print(f"{PINK}Warning: This method is only intended, and will likely only work, for the Clean Chat! {RESET}")
 
         messages = []
-        for message in reversed(self):
+        messages_tokens = 0
+        for i in range(len(self) - 1, -1, -1):
+            message = self[i]
             if message['sender'] == "System":
                 continue
             elif message['sender'] == sender:
-                if count_context_length(message['text'] + str(messages)) < config.max_prompt_tokens:
+                message_tokens = self.get_message_tokens(i)
+                if messages_tokens + message_tokens < config.max_prompt_tokens:
                     messages.append(message)
+                    messages_tokens += message_tokens
             else:
                 break
         if len(messages) == 1:
@@ -101,21 +161,38 @@ class Chat(list):
                 message_str += f"{message}\n"
             return message_str
 
+    @staticmethod
+    def message_to_xml_str(message):
+        return f"<message sender='{message['sender']}'>\n<![CDATA[\n{message['text']}\n]]>\n</message>"
+
+    def get_message_tokens(self, index: int, persist: bool = True):
+        """
+        Returns the token count of the XML representation of the message at `index`.
+        The count is cached per message index (and stored with the message) and only recomputed if the selected model
+        changed.
+        """
+        model, tokens = self._message_tokens.get(index, (None, None))
+        if tokens is None or model != config.selected_model:
+            tokens = count_context_length(self.message_to_xml_str(self[index]))
+            self._message_tokens[index] = (config.selected_model, tokens)
+            if persist:
+                self.chat_store.update_token_count(index, tokens, config.selected_model)
+        return tokens
+
     def get_last_n_tokens_in_xml_str(self, n: int):
-        xml_str = ""
-        for i in range(n):
-            try:
-                last_message = self[-(i+1)]
-            except IndexError:
-                break
-            xml_str_message = f"<message sender='{last_message['sender']}'>\n<![CDATA[\n{last_message['text']}\n]]>\n</message>"
-            tmp_xml_str = f"{xml_str_message}\n{xml_str}"
-            if count_context_length(tmp_xml_str) > (n-100):
-                omitted_messages = f"<message sender='System'>Omitted {len(self) - i} messages</message>"
-                xml_str = f"{omitted_messages}\n{xml_str}"
+        # Select the window from the tail by summing the cached per-message token counts
+        window_start = len(self)
+        window_tokens = 0
+        for i in range(len(self) - 1, -1, -1):
+            window_tokens += self.get_message_tokens(i)
+            if window_tokens > (n-100):
                 break
-            else:
-                xml_str = tmp_xml_str
+            window_start = i
+
+        xml_str = "".join(f"{self.message_to_xml_str(message)}\n" for message in self[window_start:])
+        if window_start > 0:
+            omitted_messages = f"<message sender='System'>Omitted {window_start} messages</message>"
+            xml_str = f"{omitted_messages}\n{xml_str}"
         xml_str = f'<chat>\n{xml_str}\n</chat>'
         # print(f"XML string: {xml_str}")
         return xml_str
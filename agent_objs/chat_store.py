@@ -0,0 +1,297 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+import config
+import util
+from util.colors import PINK, RESET
+
+# open journals, closed (and synced) once at exit
+_journal_stores = weakref.WeakSet()
+
+
+class JournalChatStore:
+    """
+    Persists a chat as an append-only JSONL journal (one message per line).
+    Appending a message writes only that message, fsyncs are batched, and the journal is
+    compacted (rewritten atomically) on restore if it had to be repaired or migrated.
+    """
+
+    def __init__(self, chat_dir: str, chat_name: str):
+        self.chat_dir = chat_dir
+        self.chat_name = chat_name
+        self.journal_file = os.path.join(chat_dir, f"{chat_name}.jsonl")
+        self.legacy_file = os.path.join(chat_dir, f"{chat_name}.json")
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced_messages = 0
+        self._last_sync = time.monotonic()
+        _journal_stores.add(self)
+
+    def load(self) -> list:
+        """
+        Restores the messages of the chat. Torn or corrupt lines (e.g. after a crash between fsyncs) are skipped,
+        and a chat stored in the old single JSON file format is migrated to the journal.
+        """
+        needs_compaction = False
+        messages = []
+
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        messages.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        print(f"{PINK}Skipping corrupt line in chat journal `{self.journal_file}`{RESET}")
+                        needs_compaction = True
+        elif os.path.exists(self.legacy_file):
+            try:
+                messages = util.load_json(self.legacy_file)
+                needs_compaction = True
+            except Exception as e:
+                print(f"{PINK}Could not migrate chat `{self.legacy_file}`: {e}{RESET}")
+                messages = []
+
+        if needs_compaction:
+            self.compact(messages)
+            if os.path.exists(self.legacy_file):
+                util.delete_file(self.legacy_file)
+        return messages
+
+    def _open(self):
+        if self._file is None:
+            util.ensure_directory_exists(self.chat_dir)
+            self._file = open(self.journal_file, "a", encoding="utf-8")
+        return self._file
+
+    def append(self, message: dict, tokens: int = None, token_model: str = None):
+        """Token counts are not journaled, they are counted again after a restart."""
+        line = json.dumps(message, ensure_ascii=False) + "\n"
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            self._unsynced_messages += 1
+            if (self._unsynced_messages >= config.CHAT_JOURNAL_FSYNC_EVERY or
+                    time.monotonic() - self._last_sync >= config.CHAT_JOURNAL_FSYNC_INTERVAL):
+                self._sync()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced_messages:
+            os.fsync(self._file.fileno())
+        self._unsynced_messages = 0
+        self._last_sync = time.monotonic()
+
+    def load_token_counts(self) -> dict:
+        return {}
+
+    def update_token_count(self, seq: int, tokens: int, token_model: str):
+        pass
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def compact(self, messages: list):
+        """Atomically rewrites the journal so that it contains exactly `messages`."""
+        with self._lock:
+            self._close_file()
+            util.ensure_directory_exists(self.chat_dir)
+            tmp_file = f"{self.journal_file}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                for message in messages:
+                    f.write(json.dumps(message, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.journal_file)
+
+    def clear(self):
+        with self._lock:
+            self._close_file()
+            if os.path.exists(self.journal_file):
+                util.delete_file(self.journal_file)
+            if os.path.exists(self.legacy_file):
+                util.delete_file(self.legacy_file)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._sync()
+                self._file.close()
+            except Exception as e:
+                print(f"{PINK}Error closing chat journal `{self.journal_file}`: {e}{RESET}")
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def get_file(self):
+        return self.journal_file
+
+
+@atexit.register
+def close_journal_stores():
+    for store in list(_journal_stores):
+        store.close()
+
+
+SQLITE_DB_NAME = "chats.sqlite3"
+MESSAGE_COLUMNS = ("sender", "text")
+
+# --- One shared connection (and lock) per database file ---
+_sqlite_connections = {}
+_sqlite_connections_lock = threading.Lock()
+
+
+def _get_sqlite_connection(db_path: str):
+    with _sqlite_connections_lock:
+        if db_path in _sqlite_connections:
+            connection, lock = _sqlite_connections[db_path]
+            if os.path.exists(db_path):
+                return connection, lock
+            # The database was deleted underneath us (e.g. by an agent reset), open a new one
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+        util.ensure_directory_exists(os.path.dirname(db_path))
+        connection = sqlite3.connect(db_path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "chat TEXT NOT NULL, "
+            "seq INTEGER NOT NULL, "
+            "sender TEXT NOT NULL, "
+            "text TEXT NOT NULL, "
+            "tokens INTEGER, "
+            "token_model TEXT, "
+            "extra TEXT, "
+            "PRIMARY KEY (chat, seq))"
+        )
+        columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+        for column, column_type in (("tokens", "INTEGER"), ("token_model", "TEXT")):
+            if column not in columns:
+                # databases created while the token counts were not stored
+                connection.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+        connection.commit()
+        lock = threading.Lock()
+        _sqlite_connections[db_path] = (connection, lock)
+        return connection, lock
+
+
+def _row_to_message(row) -> dict:
+    sender, text, extra = row
+    message = json.loads(extra) if extra else {}
+    message["sender"] = sender
+    message["text"] = text
+    return message
+
+
+class SQLiteChatStore:
+    """
+    Persists chats in a SQLite database (one per agent system directory) in WAL mode.
+    Messages are keyed by (chat, seq), so appending a message is a single insert, and the token count of every
+    message is stored next to it, so a restored chat does not count its history again. `Chat` keeps the messages in
+    memory and answers tail reads, sender lookups and pagination from there, so the store is only read once per chat.
+    """
+
+    def __init__(self, chat_dir: str, chat_name: str):
+        self.chat_dir = chat_dir
+        self.chat_name = chat_name
+        self.db_file = os.path.join(chat_dir, SQLITE_DB_NAME)
+        self._next_seq = 0
+
+    def _connection(self):
+        return _get_sqlite_connection(self.db_file)
+
+    def load(self) -> list:
+        connection, lock = self._connection()
+        with lock:
+            rows = connection.execute(
+                "SELECT sender, text, extra FROM messages WHERE chat = ? ORDER BY seq",
+                (self.chat_name,)
+            ).fetchall()
+            last_seq = connection.execute(
+                "SELECT MAX(seq) FROM messages WHERE chat = ?", (self.chat_name,)
+            ).fetchone()[0]
+        self._next_seq = 0 if last_seq is None else last_seq + 1
+        messages = [_row_to_message(row) for row in rows]
+
+        if not messages:
+            # Migrate a chat that was stored as a journal (or legacy JSON file) before
+            journal_store = JournalChatStore(self.chat_dir, self.chat_name)
+            if os.path.exists(journal_store.journal_file) or os.path.exists(journal_store.legacy_file):
+                messages = journal_store.load()
+                for message in messages:
+                    self.append(message)
+                journal_store.clear()
+        return messages
+
+    def append(self, message: dict, tokens: int = None, token_model: str = None):
+        extra = {key: value for key, value in message.items() if key not in MESSAGE_COLUMNS}
+        connection, lock = self._connection()
+        with lock:
+            connection.execute(
+                "INSERT INTO messages (chat, seq, sender, text, tokens, token_model, extra) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.chat_name, self._next_seq, message["sender"], message["text"], tokens, token_model,
+                 json.dumps(extra) if extra else None)
+            )
+            connection.commit()
+            self._next_seq += 1
+
+    def load_token_counts(self) -> dict:
+        """Returns {seq: (token model, tokens)} of the messages with a stored token count."""
+        connection, lock = self._connection()
+        with lock:
+            rows = connection.execute(
+                "SELECT seq, token_model, tokens FROM messages WHERE chat = ? AND tokens IS NOT NULL",
+                (self.chat_name,)
+            ).fetchall()
+        return {seq: (token_model, tokens) for seq, token_model, tokens in rows}
+
+    def update_token_count(self, seq: int, tokens: int, token_model: str):
+        connection, lock = self._connection()
+        with lock:
+            connection.execute(
+                "UPDATE messages SET tokens = ?, token_model = ? WHERE chat = ? AND seq = ?",
+                (tokens, token_model, self.chat_name, seq)
+            )
+            connection.commit()
+
+    def flush(self):
+        pass
+
+    def compact(self, messages: list):
+        pass
+
+    def clear(self):
+        connection, lock = self._connection()
+        with lock:
+            connection.execute("DELETE FROM messages WHERE chat = ?", (self.chat_name,))
+            connection.commit()
+        self._next_seq = 0
+
+    def close(self):
+        pass
+
+    def get_file(self):
+        return self.db_file
+
+
+def get_chat_store(chat_dir: str, chat_name: str):
+    """Returns the chat store of the configured backend (`journal` or `sqlite`)."""
+    if config.CHAT_STORE_BACKEND == "sqlite":
+        return SQLiteChatStore(chat_dir, chat_name)
+    return JournalChatStore(chat_dir, chat_name)
+
@@ -1,10 +1,20 @@
 import ast
+import hashlib
 import socket
+import threading
 from datetime import datetime
 import docker, tempfile, os
+import requests
 
 
+from agent_objs import result_cache
+from agent_objs.container_pool import get_container_pool, RUN_DIR
 from agent_objs.dash_app_evaluation import evaluate_dash_app
+from agent_objs.execution_snapshot import get_directory_digest, is_snapshot_valid, split_definitions, \
+    get_restore_code, get_snapshot_epilogue, SNAPSHOT_DIR
+from agent_objs.image_cache import get_requirements_image
+from agent_objs.log_capture import LogCapture
+from agent_objs.result_cache import get_result_key, get_output_digests
 from config import DEBUG
 from util import save_file
 from util.colors import WHITE, RESET, LIGHT_GREEN, PINK, RED
@@ -24,10 +34,36 @@ DEFAULT_REQUIREMENTS = {
 MEM_LIMIT = "1025m"
 TIMEOUT = 50
 CPU_QUOTA = 100000
+LOG_HEAD_CHARS = 20_000 # the start of the logs that is always kept
+LOG_TAIL_CHARS = 20_000 # and the end, kept in a ring buffer while the script runs
 
 CUSTOM_PYTHON_DOCKERFILE = os.getenv("CUSTOM_PYTHON_DOCKERFILE", "custom-python")
 D_IN_D = os.getenv("D_IN_D", False)
 
+CODE_POOL_SIZE = int(os.getenv("CODE_POOL_SIZE", 2)) # warm containers per agent system, 0 disables the pool
+CODE_POOL_MAX_RUNS = 20 # runs after which a pooled container is replaced by a fresh one
+CODE_POOL_IDLE_TIMEOUT = int(os.getenv("CODE_POOL_IDLE_TIMEOUT", 600)) # seconds after which an idle pooled container is removed
+
+def get_docker_host_path(path: str):
+    """Returns the path under which the Docker daemon sees a local path (differs for Docker-in-Docker)."""
+    if D_IN_D:
+        return path[path.index("agent_files")-1:]
+    return path
+
+_output_callback = None
+
+def register_output_callback(callback_func):
+    """Registers a function to be called with every chunk of output of a running script."""
+    global _output_callback
+    _output_callback = callback_func
+
+def _notify_output(payload: dict):
+    if _output_callback:
+        try:
+            _output_callback(payload)
+        except Exception as e:
+            print(f"Error in output callback: {e}")
+
 def find_available_port(host='localhost'):
     """
     Finds and reserves an available port by binding to port 0.
@@ -115,15 +151,50 @@ class Code:
         save_file(self.code_file_path, self.get_display_code())
         pass
 
-    def get_execution_code(self, injection_code_front=""):
+    def get_execution_code(self, injection_code_front="", use_snapshots=True):
         if self.code_imports:
             for code_obj in self.code_imports:
-                execution_code = code_obj.get_execution_code()
-                injection_code_front += execution_code
+                restore_code = code_obj.get_restore_code() if use_snapshots else None
+                if restore_code is not None:
+                    # the imported code ran before with the same source and inputs, so its state is restored
+                    injection_code_front += restore_code
+                else:
+                    injection_code_front += code_obj.get_execution_code(use_snapshots=use_snapshots)
+                    if use_snapshots:
+                        # only imported code is snapshotted, right after it ran as part of this code
+                        injection_code_front += get_snapshot_epilogue(code_obj.name, code_obj.get_snapshot_key())
 
         # Prepend the injection code to the user-provided code.
         return injection_code_front + "\n" + self.code + "\n"
 
+    def get_definitions(self):
+        """Imports, classes and functions of this code and the code it imports, see `split_definitions`."""
+        imports_and_classes, functions = "", ""
+        for code_obj in self.code_imports or []:
+            definitions = code_obj.get_definitions()
+            if definitions is None:
+                return None
+            imports_and_classes += definitions[0]
+            functions += definitions[1]
+        definitions = split_definitions(self.code)
+        if definitions is None:
+            return None
+        return imports_and_classes + definitions[0], functions + definitions[1]
+
+    def get_snapshot_key(self):
+        """Changes whenever the code, the code it imports or the uploaded files change."""
+        source = self.get_execution_code(use_snapshots=False)
+        return hashlib.sha256(f"{source}\n{get_directory_digest(self.input_dir)}".encode("utf-8")).hexdigest()
+
+    def get_restore_code(self):
+        """Code restoring the state of the last run of this code, or None if there is no valid snapshot of it."""
+        if not is_snapshot_valid(self.output_dir, self.name, self.get_snapshot_key()):
+            return None
+        definitions = self.get_definitions()
+        if definitions is None:
+            return None
+        return definitions[0] + get_restore_code(self.name) + definitions[1]
+
     def get_main_code(self, port):
         return f"""
 from agent_code import app
@@ -134,14 +205,73 @@ if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port={port})                       
         """
 
+    def create_log_capture(self) -> LogCapture:
+        def forward_output(text):
+            _notify_output({"agent_system": self.agent_system.get_name(), "code": self.name, "output": text})
+        return LogCapture(LOG_HEAD_CHARS, LOG_TAIL_CHARS, on_output=forward_output)
+
+    def execute_in_pool(self, execution_code: str, log_capture: LogCapture) -> int:
+        """
+        Runs the code in a warm container of the agent system's pool, see `agent_objs.container_pool`.
+        :return: the exit code of the script
+        """
+        pool = get_container_pool(
+            CUSTOM_PYTHON_DOCKERFILE,
+            {get_docker_host_path(self.input_dir): {"bind": "/code/uploads/", "mode": "rw"},
+             get_docker_host_path(self.output_dir): {"bind": "/code/output/", "mode": "rw"}},
+            os.path.join(self.agent_system.agent_system_dir, ".code_pool"),
+            CODE_POOL_SIZE,
+            CODE_POOL_MAX_RUNS,
+            host_path=get_docker_host_path,
+            idle_timeout=CODE_POOL_IDLE_TIMEOUT,
+            network_disabled=False,
+            mem_limit=MEM_LIMIT,  # Limit memory usage.
+            cpu_quota=CPU_QUOTA,  # Limit CPU time.
+        )
+        # the working directory is the pooled container's scratch space, uploads/ and output/ are linked into it
+        command = ["timeout", str(TIMEOUT), "sh", "-c",
+                   f"ln -sfn /code/uploads uploads && ln -sfn /code/output output && "
+                   f"exec python {RUN_DIR}/agent_code.py"]
+        exit_code = pool.run(execution_code, command, log_capture)
+        if exit_code == 124:
+            log_capture.write(f"\nExecution timed out after {TIMEOUT} seconds.")
+        return exit_code
+
     def execute(self):
         self.save_code()
+        container = None
+        log_capture = self.create_log_capture()
 
+        result_key = None
         try:
+            if not self.frontend and result_cache.RESULT_CACHE_ENABLED:
+                # an identical run (same code, imports, requirements, uploads and image) already happened,
+                # its logs and output files are reused instead of starting a container
+                snapshot_key = self.get_snapshot_key()
+                image_id = docker.from_env().images.get(CUSTOM_PYTHON_DOCKERFILE).id
+                result_key = get_result_key(snapshot_key, self.requirements, image_id)
+                logs = result_cache.get(result_key, self.output_dir)
+                if logs is not None:
+                    self.logs = logs
+                    print(self.logs)
+                    return
+                outputs_before = get_output_digests(self.output_dir)
+
             execution_code = self.get_execution_code("import pickle \n"
                                                      "import os\n"
                                                      "os.makedirs('output', exist_ok=True)\n")
 
+            if CODE_POOL_SIZE > 0 and not self.frontend and not self.requirements:
+                # frontends need a published port and extra requirements would pollute the container,
+                # so only those still get a one-shot container
+                exit_code = self.execute_in_pool(execution_code, log_capture)
+                self.logs = log_capture.get_text()
+                print(self.logs)
+                # failed runs (tracebacks, timeouts, OOM kills) are always run again
+                if result_key is not None and exit_code == 0:
+                    result_cache.put(result_key, self.logs, self.output_dir, outputs_before)
+                return
+
             # Create a temporary directory for the wrapped code file.
             with tempfile.TemporaryDirectory() as temp_dir:
                 # Save the combined code into the temporary directory.
@@ -150,20 +280,10 @@ if __name__ == '__main__':
                     f.write(execution_code)
                 start_command = "python /code/agent_code.py"
 
-                if D_IN_D:
-                    # Use Docker-in-Docker (DinD) for the container.
-                    input_dir_index = self.input_dir.index("agent_files")
-                    input_dir = self.input_dir[input_dir_index-1:]
-                    output_dir_index = self.output_dir.index("agent_files")
-                    output_dir = self.output_dir[output_dir_index-1:]
-
-                    volumes = {code_path: {"bind": "/code/agent_code.py", "mode": "rw"},
-                               input_dir: {"bind": "/code/uploads/", "mode": "rw"},
-                               output_dir: {"bind": "/code/output/", "mode": "rw"}}
-                else:
-                    volumes = {code_path: {"bind": "/code/agent_code.py", "mode": "rw"},
-                               self.input_dir: {"bind": "/code/uploads/", "mode": "rw"},
-                               self.output_dir: {"bind": "/code/output/", "mode": "rw"}}
+                # Use Docker-in-Docker (DinD) paths for the uploads and output if needed.
+                volumes = {code_path: {"bind": "/code/agent_code.py", "mode": "rw"},
+                           get_docker_host_path(self.input_dir): {"bind": "/code/uploads/", "mode": "rw"},
+                           get_docker_host_path(self.output_dir): {"bind": "/code/output/", "mode": "rw"}}
 
                 if DEBUG:
                     for file in os.listdir(self.input_dir):
@@ -172,14 +292,12 @@ if __name__ == '__main__':
                 if self.frontend:
                     start_command = f"python /code/main.py"
 
-                # Process any extra requirements.
+                # Process any extra requirements: they are installed once into a derived image that is reused
+                # by later runs with the same requirements, instead of running pip before every execution.
+                image = CUSTOM_PYTHON_DOCKERFILE
                 if self.requirements:
-                    req_str = " ".join(self.requirements)
-                    # Enable network access to allow pip to install missing packages.
-                    command = f"sh -c 'pip install {req_str} && {start_command}'"
-                else:
-                    # Nothing extra to install.
-                    command = start_command
+                    image = get_requirements_image(CUSTOM_PYTHON_DOCKERFILE, self.requirements, get_docker_host_path)
+                command = start_command
 
                 # Set up and run the Docker container with security restrictions.
                 client = docker.from_env()
@@ -192,7 +310,7 @@ if __name__ == '__main__':
                     volumes[main_path] = {"bind": "/code/main.py", "mode": "rw"}
 
                     container = client.containers.run(
-                        CUSTOM_PYTHON_DOCKERFILE,  # Ensure this image is built from your CustomPythonDockerfile.
+                        image,  # Built from your CustomPythonDockerfile (plus the extra requirements).
                         command=command,
                         volumes=volumes,
                         network_disabled=False,
@@ -202,12 +320,13 @@ if __name__ == '__main__':
                         remove=False,
                         ports={port: port}
                     )
+                    log_reader = self.start_log_reader(container, log_capture)
                     self.dash_evaluation = evaluate_dash_app(port, self.code_dir)
                     print("container ID: ", container.id)
-                    # container.wait(timeout=TIMEOUT*100)
+                    container.stop()  # ends the log stream of the server
                 else:
                     container = client.containers.run(
-                        CUSTOM_PYTHON_DOCKERFILE,  # Ensure this image is built from your CustomPythonDockerfile.
+                        image,  # Built from your CustomPythonDockerfile (plus the extra requirements).
                         command=command,
                         volumes=volumes,
                         network_disabled=False,
@@ -216,11 +335,18 @@ if __name__ == '__main__':
                         detach=True,
                         remove=False  # Auto-remove the container after execution.
                     )
-                    container.wait(timeout=TIMEOUT)
-                logs = container.logs().decode()
-                print(logs)
-
-                self.logs = logs
+                    log_reader = self.start_log_reader(container, log_capture)
+                    try:
+                        exit_code = container.wait(timeout=TIMEOUT)["StatusCode"]
+                    except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError):
+                        log_capture.write(f"\nExecution timed out after {TIMEOUT} seconds.")
+                        container.stop()
+                        exit_code = None
+                log_reader.join(timeout=10)
+                self.logs = log_capture.get_text()
+                print(self.logs)
+                if result_key is not None and exit_code == 0:
+                    result_cache.put(result_key, self.logs, self.output_dir, outputs_before)
 
         except Exception as e:
             print(f"Error executing code: {e}")
@@ -242,6 +368,14 @@ if __name__ == '__main__':
             except Exception as e:
                 print(f"Error cleaning up container: {e}")
 
+    @staticmethod
+    def start_log_reader(container, log_capture: LogCapture) -> threading.Thread:
+        """Streams the container's logs into the capture while it runs."""
+        log_reader = threading.Thread(target=log_capture.consume, args=(container.logs(stream=True, follow=True),),
+                                      daemon=True)
+        log_reader.start()
+        return log_reader
+
     def get_results_xml(self):
         results = (
             f"Here are the results from the code execution:\n"
@@ -266,6 +400,8 @@ if __name__ == '__main__':
 
         output_files = []
         for file in os.listdir(self.output_dir):
+            if file == SNAPSHOT_DIR:
+                continue
             output_files.append(os.path.join(self.output_dir, file))
 
         jsonable_class = [self.code, list(self.requirements),
@@ -0,0 +1,294 @@
+import atexit
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+
+import docker
+
+from config import DEBUG
+from util.colors import PINK, RESET, WHITE
+
+POOL_LABEL = "agent-code-pool" # "<hostname>:<pid>:<process token>" of the process that owns the container
+RUN_DIR_LABEL = "agent-code-pool-run-dir" # host side of the container's run directory
+RUN_DIR = "/code/run"  # bind-mounted per container, holds the script of the current run
+SANDBOX_DIR = "/sandbox"  # tmpfs, working directory of the runs, wiped after each run
+IDLE_CHECK_INTERVAL = 60 # seconds between checks for containers idle longer than the pool's idle timeout
+
+# tells this process apart from an earlier one with the same hostname and pid (e.g. a restarted container)
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+# kills what a run left behind (including processes it detached) and wipes the scratch space
+RESET_COMMAND = ["sh", "-c", f"kill -9 -1 2>/dev/null; rm -rf {SANDBOX_DIR}/* {SANDBOX_DIR}/.[!.]* /tmp/* 2>/dev/null; true"]
+
+
+class PooledContainer:
+    def __init__(self, container, run_dir: str):
+        self.container = container
+        self.run_dir = run_dir  # host side of RUN_DIR
+        self.runs = 0
+        self.idle_since = time.monotonic()
+
+
+class ContainerPool:
+    """
+    Pre-started sandbox containers with fixed volumes, so a script run only pays for a `docker exec`
+    instead of creating, starting, stopping and removing a container.
+    The containers idle (`sleep infinity`) and every run is executed through Docker's exec API, with the same memory
+    and CPU limits as one-shot containers. After each run, the container is reset (leftover processes are killed and
+    the tmpfs scratch space is wiped), after `max_runs` runs it is replaced by a fresh one. Containers that idled
+    for `idle_timeout` seconds are removed, the pool is filled again on the next lease.
+    """
+
+    def __init__(self, image: str, volumes: dict, run_root: str, size: int, max_runs: int, host_path=None,
+                 idle_timeout: float = None, **container_kwargs):
+        """
+        :param volumes: volumes mounted into every container (e.g. uploads/ and output/ of an agent system)
+        :param run_root: directory in which the per-container run directories are created
+        :param host_path: maps a local path to the path the Docker daemon sees (Docker-in-Docker)
+        :param idle_timeout: seconds after which an idle container is removed, None keeps them
+        :param container_kwargs: limits passed to `containers.run`, e.g. mem_limit and cpu_quota
+        """
+        self.image = image
+        self.volumes = volumes
+        self.run_root = run_root
+        self.size = size
+        self.max_runs = max_runs
+        self.host_path = host_path or (lambda path: path)
+        self.idle_timeout = idle_timeout
+        self.container_kwargs = container_kwargs
+
+        self._idle = []
+        self._total = 0  # idle, leased and starting containers
+        self._condition = threading.Condition()
+        self._next_id = 0
+        self._closed = False
+
+    def _start_container(self) -> PooledContainer:
+        with self._condition:
+            run_dir = os.path.join(self.run_root, str(self._next_id))
+            self._next_id += 1
+        os.makedirs(run_dir, exist_ok=True)
+        volumes = dict(self.volumes)
+        volumes[self.host_path(run_dir)] = {"bind": RUN_DIR, "mode": "ro"}
+        container = docker.from_env().containers.run(
+            self.image,
+            command=["sleep", "infinity"],
+            volumes=volumes,
+            tmpfs={SANDBOX_DIR: "", "/tmp": ""},
+            working_dir=SANDBOX_DIR,
+            labels={POOL_LABEL: _get_owner(), RUN_DIR_LABEL: run_dir},
+            detach=True,
+            remove=False,
+            **self.container_kwargs
+        )
+        if DEBUG:
+            print(f"{WHITE}Started pooled container {container.short_id}{RESET}")
+        return PooledContainer(container, run_dir)
+
+    def _warm_up(self):
+        """Starts containers in the background until the pool is full."""
+        with self._condition:
+            missing = self.size - self._total
+            if missing <= 0:
+                return
+            self._total += missing
+        for _ in range(missing):
+            threading.Thread(target=self._add_container, daemon=True).start()
+
+    def _add_container(self):
+        try:
+            pooled = self._start_container()
+        except Exception as e:
+            print(f"{PINK}Could not start a pooled container: {e}{RESET}")
+            with self._condition:
+                self._total -= 1
+                self._condition.notify_all()
+            return
+        with self._condition:
+            if self._closed:
+                self._total -= 1
+                self._remove(pooled)
+                return
+            pooled.idle_since = time.monotonic()
+            self._idle.append(pooled)
+            self._condition.notify_all()
+
+    def lease(self, timeout: float = None) -> PooledContainer:
+        """Returns an idle, running container of the pool, starting one if the pool is not full yet."""
+        self._warm_up()
+        with self._condition:
+            while True:
+                while self._idle:
+                    pooled = self._idle.pop()
+                    try:
+                        pooled.container.reload()
+                        if pooled.container.status == "running":
+                            return pooled
+                    except Exception:
+                        pass
+                    self._total -= 1
+                    self._remove(pooled)
+                if self._total == 0:
+                    raise RuntimeError("No pooled container could be started.")
+                if not self._condition.wait(timeout=timeout):
+                    raise TimeoutError("No pooled container became available.")
+
+    def release(self, pooled: PooledContainer):
+        """Resets the container and returns it to the pool, or replaces it once it served `max_runs` runs."""
+        pooled.runs += 1
+        healthy = pooled.runs < self.max_runs
+        if healthy:
+            try:
+                pooled.container.exec_run(RESET_COMMAND)
+            except Exception as e:
+                print(f"{PINK}Could not reset pooled container {pooled.container.short_id}: {e}{RESET}")
+                healthy = False
+        with self._condition:
+            if healthy and not self._closed:
+                pooled.idle_since = time.monotonic()
+                self._idle.append(pooled)
+                self._condition.notify_all()
+                return
+            self._total -= 1
+        threading.Thread(target=self._remove, args=(pooled,), daemon=True).start()
+        if not self._closed:
+            self._warm_up()
+
+    def run(self, code: str, command: list, log_capture) -> int:
+        """
+        Runs `command` on the script `code` (saved as RUN_DIR/agent_code.py) in a leased container and streams
+        its combined stdout and stderr into `log_capture` (see `agent_objs.log_capture`).
+        :return: the exit code
+        """
+        pooled = self.lease()
+        try:
+            with open(os.path.join(pooled.run_dir, "agent_code.py"), "w") as f:
+                f.write(code)
+            api = pooled.container.client.api
+            exec_id = api.exec_create(pooled.container.id, command, workdir=SANDBOX_DIR)["Id"]
+            log_capture.consume(api.exec_start(exec_id, stream=True))
+            return api.exec_inspect(exec_id)["ExitCode"]
+        finally:
+            self.release(pooled)
+
+    @staticmethod
+    def _remove(pooled: PooledContainer):
+        try:
+            pooled.container.remove(force=True)
+        except Exception as e:
+            print(f"{PINK}Could not remove pooled container {pooled.container.short_id}: {e}{RESET}")
+        shutil.rmtree(pooled.run_dir, ignore_errors=True)
+
+    def remove_idle(self):
+        """Removes the containers that idled for longer than `idle_timeout`."""
+        if self.idle_timeout is None:
+            return
+        deadline = time.monotonic() - self.idle_timeout
+        with self._condition:
+            expired = [pooled for pooled in self._idle if pooled.idle_since < deadline]
+            if not expired:
+                return
+            self._idle = [pooled for pooled in self._idle if pooled.idle_since >= deadline]
+            self._total -= len(expired)
+        if DEBUG:
+            print(f"{WHITE}Removing {len(expired)} idle pooled containers{RESET}")
+        for pooled in expired:
+            self._remove(pooled)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for pooled in idle:
+            self._remove(pooled)
+
+
+def _get_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{_PROCESS_TOKEN}"
+
+
+def _is_process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, but belongs to another user
+    return True
+
+
+def remove_orphaned_containers():
+    """
+    Removes pooled containers (and their run directories) left behind by processes of this host that died without
+    closing their pools, e.g. after a crash or SIGKILL. A container labeled with this process's pid but another
+    process token was left by an earlier process that had the same pid (e.g. before the backend's container restarted).
+    """
+    hostname = socket.gethostname()
+    pid = str(os.getpid())
+    try:
+        containers = docker.from_env().containers.list(all=True, filters={"label": POOL_LABEL})
+    except Exception as e:
+        print(f"{PINK}Could not look for orphaned pooled containers: {e}{RESET}")
+        return
+    for container in containers:
+        owner_host, owner_pid, owner_token = (container.labels.get(POOL_LABEL, "").rsplit(":", 2) + ["", "", ""])[:3]
+        if owner_host != hostname or not owner_pid.isdigit():
+            continue  # owned by another host (shared daemon)
+        if owner_pid == pid:
+            if owner_token == _PROCESS_TOKEN:
+                continue  # one of our own
+        elif _is_process_alive(int(owner_pid)):
+            continue  # owned by another live process
+        if DEBUG:
+            print(f"{WHITE}Removing orphaned pooled container {container.short_id}{RESET}")
+        try:
+            container.remove(force=True)
+        except Exception as e:
+            print(f"{PINK}Could not remove orphaned pooled container {container.short_id}: {e}{RESET}")
+            continue
+        run_dir = container.labels.get(RUN_DIR_LABEL)
+        if run_dir:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+# --- One pool per set of volumes (i.e. per agent system) ---
+_pools = {}
+_pools_lock = threading.Lock()
+_idle_checker = None
+
+
+def _remove_idle_containers():
+    while True:
+        time.sleep(IDLE_CHECK_INTERVAL)
+        with _pools_lock:
+            pools = list(_pools.values())
+        for pool in pools:
+            pool.remove_idle()
+
+
+def get_container_pool(image: str, volumes: dict, run_root: str, size: int, max_runs: int, host_path=None,
+                       idle_timeout: float = None, **container_kwargs) -> ContainerPool:
+    global _idle_checker
+    key = (image, tuple(sorted((path, volume["bind"], volume["mode"]) for path, volume in volumes.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            remove_orphaned_containers()
+            pool = ContainerPool(image, volumes, run_root, size, max_runs, host_path, idle_timeout, **container_kwargs)
+            _pools[key] = pool
+        if _idle_checker is None:
+            _idle_checker = threading.Thread(target=_remove_idle_containers, name="container-pool-idle", daemon=True)
+            _idle_checker.start()
+        return pool
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
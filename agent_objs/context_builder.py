@@ -0,0 +1,66 @@
+from llm_functions import count_context_length
+
+# Number of characters on each side of a section boundary that are re-tokenized to correct the running total
+BOUNDARY_WINDOW = 16
+
+
+class ContextBuilder:
+    """
+    Assembles the context string section by section while keeping a running token total.
+    Every section is tokenized exactly once. The tokens of the concatenation are derived from the
+    per-section counts plus a correction for tokens that merge across the boundary of two sections.
+    """
+
+    def __init__(self, model: str = "default"):
+        self.model = model
+        self.sections: list = []
+        self.section_tokens: list = []
+        self.token_count = 0
+
+    def count(self, text: str) -> int:
+        return count_context_length(text, self.model)
+
+    def boundary_correction(self, left: str, right: str) -> int:
+        """
+        Difference between the tokens of the joined boundary window and the tokens of its two halves.
+        Usually 0 or slightly negative (when the tokenizer merges characters across the boundary).
+        """
+        if not left or not right:
+            return 0
+        left_window = left[-BOUNDARY_WINDOW:]
+        right_window = right[:BOUNDARY_WINDOW]
+        return (self.count(left_window + right_window)
+                - self.count(left_window)
+                - self.count(right_window))
+
+    def tokens_if_appended(self, text: str, tokens: int = None) -> int:
+        """
+        Returns the total token count the context would have after appending `text`, without appending it.
+        :param text: the section to be appended
+        :param tokens: the already known token count of `text`, if available
+        """
+        if tokens is None:
+            tokens = self.count(text)
+        if self.sections:
+            tokens += self.boundary_correction(self.sections[-1], text)
+        return self.token_count + tokens
+
+    def append(self, text: str, tokens: int = None) -> int:
+        """
+        Appends a section and updates the running total.
+        :param text: the section to be appended
+        :param tokens: the already known token count of `text`, if available
+        :return: the new total token count
+        """
+        if tokens is None:
+            tokens = self.count(text)
+        self.token_count = self.tokens_if_appended(text, tokens)
+        self.sections.append(text)
+        self.section_tokens.append(tokens)
+        return self.token_count
+
+    def __str__(self):
+        return "".join(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
@@ -4,14 +4,19 @@ import time
 
 from bs4 import BeautifulSoup
 import requests
-from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
 
+from agent_objs.browser_pool import get_browser_pool
 from llm_functions.llm_api_wrapper import get_image_description
 from util.colors import RED, RESET
 
 DASH_LINK = os.getenv("DASH_LINK", "http://localhost")
 
 TIMEOUT = 10000
+EVALUATION_TIMEOUT = 120 # seconds an evaluation may wait for and use a pooled browser
+
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2)) # warm Chromium instances
+BROWSER_MAX_USES = 50 # evaluations after which a browser is replaced by a fresh one
 
 def evaluate_dash_app(port=8050, code_dir="screenshots"):
     try:
@@ -127,39 +132,29 @@ def get_dash_code_and_screenshot(port=8050, screenshot_path="screenshot.png", lo
     url = f"{DASH_LINK}:{port}"  # Use localhost as Playwright runs on the host accessing the container's exposed port
     body_content = None
 
-    try:
-        if is_dash_server_responding(port):
-            p = sync_playwright().start()
-            # Launch Chromium browser. You can also use p.firefox.launch() or p.webkit.launch()
-            # Pass necessary arguments for running in Docker/headless environments
-            browser = p.chromium.launch(
-                headless=True,
-                args=[
-                    "--no-sandbox",  # Necessary for running as root in Docker
-                    '--disable-setuid-sandbox', # Necessary for running as root in Docker
-                    "--disable-dev-shm-usage",  # Overcome limited resource problems
-                    "--disable-gpu"  # Sometimes necessary in headless environments
-                ]
+    def capture(page):
+        page.goto(url, timeout=playwright_timeout)
+
+        # Wait for the loading element to disappear
+        if loading_element_class:
+            page.wait_for_function(
+                f"() => !document.querySelector('.{loading_element_class}') || "
+                f"getComputedStyle(document.querySelector('.{loading_element_class}')).display === 'none'",
+                timeout=playwright_timeout
             )
-            page = browser.new_page()
+            time.sleep(10) # Wait for additional time to ensure the page is fully loaded
+
+        # Take a screenshot
+        page.screenshot(path=screenshot_path, full_page=True)
+        print(f"Screenshot saved to {screenshot_path}")
+        return page.content()
 
+    try:
+        if is_dash_server_responding(port):
+            # The page is opened in a warm browser of the pool (see `agent_objs.browser_pool`)
             try:
-                page.goto(url, timeout=playwright_timeout)
-
-                # Wait for the loading element to disappear
-                if loading_element_class:
-                    page.wait_for_function(
-                        f"() => !document.querySelector('.{loading_element_class}') || "
-                        f"getComputedStyle(document.querySelector('.{loading_element_class}')).display === 'none'",
-                        timeout=playwright_timeout
-                    )
-                    time.sleep(10) # Wait for additional time to ensure the page is fully loaded
-
-                # Take a screenshot
-                page.screenshot(path=screenshot_path, full_page=True)
-                print(f"Screenshot saved to {screenshot_path}")
-
-                html_content_ = page.content()
+                html_content_ = get_browser_pool(BROWSER_POOL_SIZE, BROWSER_MAX_USES).run(
+                    capture, timeout=EVALUATION_TIMEOUT)
                 soup = BeautifulSoup(html_content_, 'html.parser')
 
                 # Remove the footer element if it exists
@@ -173,13 +168,6 @@ def get_dash_code_and_screenshot(port=8050, screenshot_path="screenshot.png", lo
                 print(f"{RED}Playwright Timeout error ({TIMEOUT}s) or element was not found at {url}.{RESET}")
                 body_content = "Timeout error: Element not found or navigation failed."
                 screenshot_path = None
-            try:
-                # Ensure the browser is closed
-                browser.close()
-            except Exception as e:
-                print(f"{RED} Error closing browser: {e} {RESET}")
-                body_content = "Error closing browser."
-                screenshot_path = None
     except Exception as e:
         # Catch any other unexpected errors (e.g., Playwright installation issues)
         print(f"An unexpected error occurred: {e}")
@@ -0,0 +1,134 @@
+import ast
+import hashlib
+import os
+import textwrap
+import threading
+
+SNAPSHOT_DIR = ".snapshots" # below output/, holds the pickled globals of finished runs
+SNAPSHOT_MAX_BYTES = 256 * 1024 ** 2 # larger states are not snapshotted, the code is re-run instead
+
+_file_digests = {}  # (path, size, mtime) -> digest, so unchanged uploads are not hashed again
+_lock = threading.Lock()
+
+
+def get_file_digest(path: str) -> str:
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        digest = _file_digests.get(key)
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        with _lock:
+            _file_digests[key] = digest
+    return digest
+
+
+def get_directory_digest(directory: str) -> str:
+    """Digest over the names and contents of all files below the directory."""
+    hasher = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            hasher.update(os.path.relpath(path, directory).encode("utf-8", "surrogatepass"))
+            hasher.update(get_file_digest(path).encode())
+    return hasher.hexdigest()
+
+
+def get_snapshot_paths(output_dir: str, name: str):
+    return (os.path.join(output_dir, SNAPSHOT_DIR, f"{name}.pkl"),
+            os.path.join(output_dir, SNAPSHOT_DIR, f"{name}.key"))
+
+
+def is_snapshot_valid(output_dir: str, name: str, key: str) -> bool:
+    snapshot_path, key_path = get_snapshot_paths(output_dir, name)
+    if not os.path.exists(snapshot_path) or not os.path.exists(key_path):
+        return False
+    with open(key_path, "r") as f:
+        return f.read().strip() == key
+
+
+def _guarded(statement_code: str) -> str:
+    return (f"try:\n{textwrap.indent(statement_code, '    ')}\n"
+            f"except Exception as _definition_error:\n"
+            f"    print('Could not restore a definition:', repr(_definition_error))\n")
+
+
+def split_definitions(source: str):
+    """
+    Returns the top-level imports and class definitions, and the function definitions of the source, which have
+    to be re-run next to a restored snapshot (functions and classes are pickled by reference, not by value).
+    Returns None if the source can not be parsed.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError:
+        return None
+    imports_and_classes, functions = [], []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports_and_classes.append(_guarded(ast.unparse(node)))
+        elif isinstance(node, ast.ClassDef):
+            imports_and_classes.append(_guarded(ast.unparse(node)))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # decorators may refer to restored globals, so functions come after the snapshot
+            functions.append(_guarded(ast.unparse(node)))
+    return "".join(imports_and_classes), "".join(functions)
+
+
+def get_restore_code(name: str) -> str:
+    snapshot_path = f"output/{SNAPSHOT_DIR}/{name}.pkl"
+    return f"""
+import pickle as _snapshot_pickle
+with open({snapshot_path!r}, "rb") as _snapshot_file:
+    for _snapshot_name, _snapshot_value in _snapshot_pickle.load(_snapshot_file).items():
+        try:
+            globals()[_snapshot_name] = _snapshot_pickle.loads(_snapshot_value)
+        except Exception as _snapshot_error:
+            print(f"Could not restore `{{_snapshot_name}}`:", repr(_snapshot_error))
+"""
+
+
+def get_snapshot_epilogue(name: str, key: str) -> str:
+    """
+    Code placed after imported code that pickles its data globals (DataFrames, arrays, models, ...) into output/.
+    The snapshot is only written if every data global can be pickled and all of them fit into SNAPSHOT_MAX_BYTES,
+    a partial snapshot would restore a broken state.
+    """
+    snapshot_path = f"output/{SNAPSHOT_DIR}/{name}.pkl"
+    key_path = f"output/{SNAPSHOT_DIR}/{name}.key"
+    return f"""
+def _write_snapshot():
+    import os as _os, pickle as _pickle, types as _types
+    snapshot = {{}}
+    size = 0
+    for name, value in list(globals().items()):
+        if name.startswith("_") or isinstance(value, (_types.ModuleType, _types.FunctionType, type)):
+            continue
+        try:
+            data = _pickle.dumps(value, protocol=5)
+        except Exception as e:
+            print(f"Not snapshotting the state of {name!r}: `{{name}}` can not be pickled ({{e!r}})")
+            return
+        size += len(data)
+        if size > {SNAPSHOT_MAX_BYTES}:
+            print(f"Not snapshotting the state of {name!r}: it is larger than {SNAPSHOT_MAX_BYTES} bytes")
+            return
+        snapshot[name] = data
+    _os.makedirs("output/{SNAPSHOT_DIR}", exist_ok=True)
+    if _os.path.exists({key_path!r}):
+        _os.remove({key_path!r})  # the key is written last, so a half-written snapshot is never valid
+    with open({snapshot_path!r}, "wb") as f:
+        _pickle.dump(snapshot, f, protocol=5)
+    with open({key_path!r}, "w") as f:
+        f.write({key!r})
+
+try:
+    _write_snapshot()
+except Exception as _snapshot_error:
+    print("Could not snapshot the globals:", repr(_snapshot_error))
+"""
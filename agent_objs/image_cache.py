@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+
+import docker
+
+from config import DEBUG
+from util import load_json, save_json
+from util.colors import PINK, RESET, WHITE
+
+IMAGE_CACHE_DISK_BUDGET = int(os.getenv("IMAGE_CACHE_DISK_BUDGET", 10 * 1024 ** 3)) # bytes of derived image layers
+IMAGE_CACHE_INDEX = "agent_files/image_cache.json" # last use of the derived images, for LRU eviction
+IMAGE_BUILD_TIMEOUT = 600
+PIP_CACHE_DIR = os.path.abspath("agent_files/.pip_cache") # mounted as pip's cache while building
+WHEEL_CACHE_DIR = os.getenv("WHEEL_CACHE_DIR") # local wheels (path as seen by the Docker daemon), optional
+OFFLINE_BUILDS = os.getenv("OFFLINE_BUILDS", "false").lower() == "true" # install only from WHEEL_CACHE_DIR
+
+REQUIREMENTS_LABEL = "agent-code-requirements"
+
+_lock = threading.Lock()
+_build_locks = {}  # image tag -> lock, so the same requirement set is only built once at a time
+
+
+def normalize_requirements(requirements) -> list:
+    normalized = sorted({requirement.strip().lower() for requirement in requirements if requirement.strip()})
+    for requirement in normalized:
+        if requirement.startswith("-"):
+            raise ValueError(f"Invalid requirement `{requirement}`: pip options are not allowed.")
+    return normalized
+
+
+def get_image_tag(base_image_id: str, base_image: str, requirements: list) -> str:
+    """Content-addressed tag: the same base image and requirement set always map to the same derived image."""
+    key = hashlib.sha256("\n".join([base_image_id] + requirements).encode("utf-8")).hexdigest()[:16]
+    # drop the digest and the tag of the base image, a ':' before the last '/' is a registry port
+    repository = base_image.split("@", 1)[0]
+    name_start = repository.rfind("/") + 1
+    if ":" in repository[name_start:]:
+        repository = repository[:repository.rindex(":")]
+    return f"{repository}-requirements:{key}"
+
+
+def _load_index() -> dict:
+    return load_json(IMAGE_CACHE_INDEX) if os.path.exists(IMAGE_CACHE_INDEX) else {}
+
+
+def _touch(tag: str, size: int = None):
+    with _lock:
+        index = _load_index()
+        entry = index.setdefault(tag, {})
+        entry["last_used"] = time.time()
+        if size is not None:
+            entry["size"] = size
+        os.makedirs(os.path.dirname(IMAGE_CACHE_INDEX), exist_ok=True)
+        save_json(IMAGE_CACHE_INDEX, index)
+
+
+def _build_image(client, base_image: str, tag: str, requirements: list, host_path):
+    """Installs the requirements into a container of the base image and commits it as the derived image."""
+    command = ["pip", "install", "--no-warn-script-location"]
+    os.makedirs(PIP_CACHE_DIR, exist_ok=True)
+    volumes = {host_path(PIP_CACHE_DIR): {"bind": "/root/.cache/pip", "mode": "rw"}}
+    if WHEEL_CACHE_DIR:
+        volumes[WHEEL_CACHE_DIR] = {"bind": "/wheels", "mode": "ro"}
+        command += ["--find-links", "/wheels"]
+        if OFFLINE_BUILDS:
+            command += ["--no-index"]
+    command += requirements
+
+    print(f"{WHITE}Building image `{tag}` with {requirements}{RESET}")
+    container = client.containers.run(base_image, command=command, volumes=volumes, detach=True,
+                                      network_disabled=OFFLINE_BUILDS)
+    try:
+        result = container.wait(timeout=IMAGE_BUILD_TIMEOUT)
+        if result["StatusCode"] != 0:
+            raise RuntimeError(f"Installing the requirements {requirements} failed:\n"
+                               f"{container.logs().decode(errors='replace')}")
+        repository, image_tag = tag.rsplit(":", 1)
+        base_config = client.images.get(base_image).attrs["Config"]
+        container.commit(repository=repository, tag=image_tag, conf={
+            "Cmd": base_config.get("Cmd"),
+            "WorkingDir": base_config.get("WorkingDir"),
+            "Labels": {REQUIREMENTS_LABEL: " ".join(requirements)},
+        })
+    finally:
+        container.remove(force=True)
+
+
+def get_requirements_image(base_image: str, requirements, host_path=None) -> str:
+    """
+    Returns the tag of an image that is `base_image` with the requirements installed, building it on first use.
+    Least recently used derived images are removed once they take more than IMAGE_CACHE_DISK_BUDGET bytes.
+    :param host_path: maps a local path to the path the Docker daemon sees (Docker-in-Docker)
+    """
+    host_path = host_path or (lambda path: path)
+    requirements = normalize_requirements(requirements)
+    client = docker.from_env()
+    base = client.images.get(base_image)
+    tag = get_image_tag(base.id, base_image, requirements)
+
+    with _lock:
+        build_lock = _build_locks.setdefault(tag, threading.Lock())
+    with build_lock:
+        try:
+            client.images.get(tag)
+            if DEBUG:
+                print(f"{WHITE}Reusing image `{tag}`{RESET}")
+            _touch(tag)
+            return tag
+        except docker.errors.ImageNotFound:
+            pass
+
+        _build_image(client, base_image, tag, requirements, host_path)
+        # only the layer with the requirements counts towards the budget, the base layers are shared
+        size = client.images.get(tag).attrs["Size"] - base.attrs["Size"]
+        _touch(tag, size)
+    evict_images(client, keep=tag)
+    return tag
+
+
+def evict_images(client=None, keep: str = None):
+    """Removes the least recently used derived images until they fit into IMAGE_CACHE_DISK_BUDGET."""
+    client = client or docker.from_env()
+    with _lock:
+        index = _load_index()
+        total = sum(entry.get("size", 0) for entry in index.values())
+        for tag, entry in sorted(index.items(), key=lambda item: item[1].get("last_used", 0)):
+            if total <= IMAGE_CACHE_DISK_BUDGET:
+                break
+            if tag == keep:
+                continue
+            try:
+                client.images.remove(tag)
+            except docker.errors.ImageNotFound:
+                pass
+            except docker.errors.APIError as e:
+                print(f"{PINK}Could not evict image `{tag}` (still in use?): {e}{RESET}")
+                continue
+            total -= entry.get("size", 0)
+            del index[tag]
+        save_json(IMAGE_CACHE_INDEX, index)
@@ -0,0 +1,112 @@
+import codecs
+import threading
+import time
+from collections import deque
+
+FORWARD_INTERVAL = 0.25 # seconds between two forwarded batches of output
+
+
+class LogCapture:
+    """
+    Collects the output of a running script as it arrives. The first `head_chars` characters are kept, the rest
+    only as a ring buffer of the last `tail_chars` characters, so multi-MB logs stay bounded.
+    The output is also passed to `on_output` (e.g. to stream it to the frontend) in batches, at most every
+    FORWARD_INTERVAL seconds and each capped to its last `tail_chars` characters, so chatty scripts do not flood it.
+    """
+
+    def __init__(self, head_chars: int, tail_chars: int, on_output=None):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.on_output = on_output
+
+        self._head = []
+        self._head_length = 0
+        self._tail = deque()
+        self._tail_length = 0
+        self._dropped = 0  # characters that fell out of the ring buffer
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._lock = threading.Lock()
+
+        self._pending = deque()  # output not forwarded yet, capped like the tail
+        self._pending_length = 0
+        self._pending_dropped = 0
+        self._last_forward = 0.0
+
+    def write_bytes(self, data: bytes):
+        # the incremental decoder keeps multi-byte characters that are split across chunks intact
+        self.write(self._decoder.decode(data))
+
+    def write(self, text: str):
+        if not text:
+            return
+        with self._lock:
+            if self.on_output is not None:
+                self._pending.append(text)
+                self._pending_length += len(text)
+                dropped = self._trim(self._pending, self._pending_length - self.tail_chars)
+                self._pending_length -= dropped
+                self._pending_dropped += dropped
+            if self._head_length < self.head_chars:
+                head_part = text[:self.head_chars - self._head_length]
+                self._head.append(head_part)
+                self._head_length += len(head_part)
+                text = text[len(head_part):]
+            if text:
+                self._tail.append(text)
+                self._tail_length += len(text)
+                dropped = self._trim(self._tail, self._tail_length - self.tail_chars)
+                self._tail_length -= dropped
+                self._dropped += dropped
+        if time.monotonic() - self._last_forward >= FORWARD_INTERVAL:
+            self.flush()
+
+    @staticmethod
+    def _trim(chunks: deque, excess: int) -> int:
+        """Removes `excess` characters from the front of the chunks, returns how many were removed."""
+        removed = 0
+        while excess > 0 and chunks:
+            oldest = chunks[0]
+            if len(oldest) <= excess:
+                chunks.popleft()
+                removed += len(oldest)
+                excess -= len(oldest)
+            else:
+                chunks[0] = oldest[excess:]
+                removed += excess
+                excess = 0
+        return removed
+
+    def flush(self):
+        """Forwards the pending output to `on_output`."""
+        if self.on_output is None:
+            return
+        with self._lock:
+            self._last_forward = time.monotonic()
+            if not self._pending:
+                return
+            text = "".join(self._pending)
+            if self._pending_dropped:
+                text = f"... [{self._pending_dropped} characters skipped] ...\n" + text
+            self._pending.clear()
+            self._pending_length = 0
+            self._pending_dropped = 0
+        try:
+            self.on_output(text)
+        except Exception as e:
+            print(f"Error in log output callback: {e}")
+
+    def consume(self, chunks):
+        """Captures an iterable of byte chunks (e.g. a Docker log or exec stream) until it ends."""
+        for chunk in chunks:
+            self.write_bytes(chunk)
+        self.write(self._decoder.decode(b"", final=True))
+        self.flush()
+
+    def get_text(self) -> str:
+        """Returns the captured text, output that was not forwarded yet is forwarded first."""
+        self.flush()
+        with self._lock:
+            text = "".join(self._head)
+            if self._dropped:
+                text += f"\n... [{self._dropped} characters truncated] ...\n"
+            return text + "".join(self._tail)
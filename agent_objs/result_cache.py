@@ -0,0 +1,157 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from agent_objs.execution_snapshot import get_file_digest
+from config import DEBUG
+from util import load_json, save_json, save_file
+from util.colors import PINK, RESET, WHITE
+
+# off by default: a run that reads the network, the clock or files outside its uploads is not reproducible
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "false").lower() == "true"
+RESULT_CACHE_DIR = os.path.abspath(os.getenv("RESULT_CACHE_DIR", "agent_files/.result_cache"))
+RESULT_CACHE_DISK_BUDGET = int(os.getenv("RESULT_CACHE_DISK_BUDGET", 2 * 1024 ** 3)) # bytes of logs and output files
+RESULT_CACHE_INDEX = os.path.join(RESULT_CACHE_DIR, "index.json") # entries with their last use, for LRU eviction
+BLOB_DIR = os.path.join(RESULT_CACHE_DIR, "blobs") # output files by digest, shared by all entries
+
+_lock = threading.Lock()
+
+
+def get_result_key(snapshot_key: str, requirements: list, image_id: str) -> str:
+    """
+    Content-addressed key of a run: the snapshot key already covers the code, the resolved imports and the uploaded
+    files, the requirements and the image id cover the environment (a rebuilt or re-pulled image gets a new id).
+    """
+    environment = "\n".join([image_id] + sorted(requirement.strip().lower() for requirement in requirements))
+    return hashlib.sha256(f"{snapshot_key}\n{environment}".encode("utf-8")).hexdigest()
+
+
+def get_output_digests(output_dir: str) -> dict:
+    """Digests of the files in the output directory by relative path, without internal files like snapshots."""
+    digests = {}
+    for root, dirs, files in os.walk(output_dir):
+        dirs[:] = [directory for directory in dirs if not directory.startswith(".")]
+        for file in files:
+            if file.startswith("."):
+                continue
+            path = os.path.join(root, file)
+            try:
+                digests[os.path.relpath(path, output_dir).replace("\\", "/")] = get_file_digest(path)
+            except OSError:
+                pass
+    return digests
+
+
+def _load_index() -> dict:
+    return load_json(RESULT_CACHE_INDEX) if os.path.exists(RESULT_CACHE_INDEX) else {}
+
+
+def _save_index(index: dict):
+    os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+    save_json(RESULT_CACHE_INDEX, index)
+
+
+def _store_blob(path: str, digest: str) -> int:
+    blob_path = os.path.join(BLOB_DIR, digest)
+    if not os.path.exists(blob_path):
+        os.makedirs(BLOB_DIR, exist_ok=True)
+        temp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, temp_path)
+        os.replace(temp_path, blob_path)
+    return os.path.getsize(blob_path)
+
+
+def _restore_blob(digest: str, path: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.copyfile(os.path.join(BLOB_DIR, digest), path)
+
+
+def get(key: str, output_dir: str):
+    """Returns the logs of a cached run and restores the output files it wrote, or returns None on a miss."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _lock:
+        index = _load_index()
+        entry = index.get(key)
+        if entry is None:
+            return None
+        try:
+            current = get_output_digests(output_dir)
+            for path, digest in entry["outputs"].items():
+                if current.get(path) != digest:
+                    _restore_blob(digest, os.path.join(output_dir, path))
+            with open(os.path.join(RESULT_CACHE_DIR, f"{key}.log"), "r") as f:
+                logs = f.read()
+        except OSError as e:
+            # a blob or the logs went missing, the entry is useless
+            print(f"{PINK}Dropping cached result {key[:12]}: {e}{RESET}")
+            del index[key]
+            _save_index(index)
+            return None
+        entry["last_used"] = time.time()
+        _save_index(index)
+    if DEBUG:
+        print(f"{WHITE}Reusing the cached result {key[:12]} with {len(entry['outputs'])} output files{RESET}")
+    return logs
+
+
+def put(key: str, logs: str, output_dir: str, outputs_before: dict):
+    """
+    Stores the logs of a finished run and the output files it created or changed (compared to `outputs_before`).
+    Least recently used entries are evicted once the cache exceeds RESULT_CACHE_DISK_BUDGET.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return
+    with _lock:
+        outputs = {path: digest for path, digest in get_output_digests(output_dir).items()
+                   if outputs_before.get(path) != digest}
+        size = len(logs.encode("utf-8"))
+        try:
+            for path, digest in outputs.items():
+                size += _store_blob(os.path.join(output_dir, path), digest)
+        except OSError as e:
+            print(f"{PINK}Could not cache the result {key[:12]}: {e}{RESET}")
+            return
+        if size > RESULT_CACHE_DISK_BUDGET:
+            return
+        save_file(os.path.join(RESULT_CACHE_DIR, f"{key}.log"), logs)
+
+        index = _load_index()
+        index[key] = {"outputs": outputs, "size": size, "last_used": time.time()}
+        _evict(index, keep=key)
+        _save_index(index)
+
+
+def _evict(index: dict, keep: str):
+    """Removes the least recently used entries until the cache fits into the budget. Requires the lock."""
+    total = sum(entry["size"] for entry in index.values())
+    for key, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+        if total <= RESULT_CACHE_DISK_BUDGET:
+            break
+        if key == keep:
+            continue
+        total -= entry["size"]
+        del index[key]
+        try:
+            os.remove(os.path.join(RESULT_CACHE_DIR, f"{key}.log"))
+        except OSError:
+            pass
+
+    # blobs are shared between entries, so only those no remaining entry refers to are removed
+    referenced = set()
+    for entry in index.values():
+        referenced.update(entry["outputs"].values())
+    if os.path.isdir(BLOB_DIR):
+        for digest in os.listdir(BLOB_DIR):
+            if digest not in referenced and not digest.endswith(".tmp"):
+                try:
+                    os.remove(os.path.join(BLOB_DIR, digest))
+                except OSError:
+                    pass
+
+
+def clear():
+    with _lock:
+        shutil.rmtree(RESULT_CACHE_DIR, ignore_errors=True)
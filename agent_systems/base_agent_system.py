@@ -1,3 +1,4 @@
+import asyncio
 import base64
 import os
 
@@ -7,6 +8,9 @@ import rag
 import util
 import config
 from agent_objs.code_manager import CodeManager
+from agent_objs.context_builder import ContextBuilder
+from agent_objs.execution_snapshot import SNAPSHOT_DIR
+from util.directory_listing import DirectoryListing
 
 from tools import command_util
 from llm_functions import count_context_length
@@ -52,6 +56,7 @@ class BaseAgentSystem:
 
         self.relative_agent_dir = f"agent_files/{self.technical_name}"
         self.agent_system_dir = os.path.abspath(self.relative_agent_dir)
+        self._document_listing = None # files in uploads/ and output/, see get_available_document_filepaths_str
 
         self.clean_chat = Chat("Clean Chat", self.system_name, self.agent_system_dir)
         self.chat = Chat(f"Chat with thinking process", self.system_name, self.agent_system_dir)
@@ -75,6 +80,7 @@ class BaseAgentSystem:
 
         self.relative_agent_dir = f"agent_files/{self.technical_name}"
         self.agent_system_dir = os.path.abspath(self.relative_agent_dir)
+        self._document_listing = None # files in uploads/ and output/, see get_available_document_filepaths_str
 
         self.clean_chat = Chat("Clean Chat", self.system_name, self.agent_system_dir)
         self.chat = Chat(f"Chat with thinking process", self.system_name, self.agent_system_dir)
@@ -154,23 +160,25 @@ class BaseAgentSystem:
                                       importance=8)
                 self.complete_chat.add_message("Extraction Failure", failure)
             self.extraction_failure = False
-        for command, response in command_responses.items():
+        for command, response in command_responses:
             self.chat.add_message(command, response)
             self.update_last_use_context("History")
             self.complete_chat.add_message(command, response)
         pass
 
-    def prompt_agent(self):
+    def get_agent_steps(self):
+        """
+        The agent loop of the system. Yields the (prompt, agent, print_thinking) of every prompt and is resumed once
+        the prompt is answered, so `prompt_agent` and `async_prompt_agent` share the loop and only differ in how
+        they prompt. Systems with their own loop override this.
+        """
         agent = self.default_agent
-
-
-        self.replying = True
         self._prompt = "# User Prompt\n" + self.clean_chat.get_last_messages_of_sender('User') + "\n"
 
         i = 0
         while self.clean_chat.get_last_sender() not in list(self.agent_dict.keys()) and i < self.max_iterations:
             print(f"Executing prompt {i + 1}")
-            self.prompt(self._prompt, agent)
+            yield self._prompt, agent, False
             i += 1
 
         if i > self.max_iterations:
@@ -179,6 +187,23 @@ class BaseAgentSystem:
             self.complete_chat.add_message("Warning", "Maximum iterations reached. Stopping prompt agent.")
             self.clean_chat.add_message("System", "Maximum iterations reached. Stopping prompt agent.")
 
+    def prompt_agent(self):
+        self.replying = True
+        for prompt, agent, print_thinking in self.get_agent_steps():
+            self.prompt(prompt, agent, print_thinking)
+        self.replying = False
+        self.send_socket_message(f"Prompted agent `{self.get_name()}`. Agent has replied.")
+        pass
+
+    async def async_prompt_agent(self):
+        if type(self).prompt_agent is not BaseAgentSystem.prompt_agent:
+            # The system has its own (synchronous) agent loop, run it off the event loop
+            await asyncio.to_thread(self.prompt_agent)
+            return
+
+        self.replying = True
+        for prompt, agent, print_thinking in self.get_agent_steps():
+            await self.async_prompt(prompt, agent, print_thinking)
         self.replying = False
         self.send_socket_message(f"Prompted agent `{self.get_name()}`. Agent has replied.")
         pass
@@ -193,29 +218,52 @@ class BaseAgentSystem:
         else:
             print(f"Message notification attempted, but no callback registered: {message}")
 
-    def prompt(self, prompt, agent=None, print_thinking=False):
+    def _start_prompt(self, agent):
         if not agent:
             agent = self.default_agent
         self.acting_agent = agent
+        return agent
 
-        response, prompt = agent.prompt(prompt)
+    def _record_prompt(self, agent, response, prompt, print_thinking):
         if print_thinking:
             self.clean_chat.add_message(agent.get_name(), response)
         self.complete_chat.add_message("Prompt", prompt)
         self.chat.add_message(agent.get_name(), response)
         self.complete_chat.add_message(agent.get_name(), response)
         self.acting_agent = self.default_agent
+
+    def prompt(self, prompt, agent=None, print_thinking=False):
+        agent = self._start_prompt(agent)
+        response, prompt = agent.prompt(prompt)
+        self._record_prompt(agent, response, prompt, print_thinking)
         pass
 
+    async def async_prompt(self, prompt, agent=None, print_thinking=False):
+        agent = self._start_prompt(agent)
+        response, prompt = await agent.async_prompt(prompt)
+        self._record_prompt(agent, response, prompt, print_thinking)
+        pass
+
+    async def async_use_tools(self, llm_response, agent):
+        # tools run code in docker and query the RAG-DB, so they are run off the event loop
+        await asyncio.to_thread(self.use_tools, llm_response, agent)
+
+    def should_reply(self, sender):
+        """Whether a message of the sender starts the agent loop."""
+        return not self.replying and sender not in list(self.agent_dict.keys()) and sender != "System"
+
     def handle_message(self, sender):
-        if self.replying:
-            pass
-        elif sender not in list(self.agent_dict.keys()) and sender != "System":
+        if self.should_reply(sender):
             self.prompt_agent()
         pass
 
+    async def async_handle_message(self, sender):
+        if self.should_reply(sender):
+            await self.async_prompt_agent()
+        pass
+
     def generate_context_data(self, agent, status_info = False):
-        context_data_str = ""
+        context_builder = ContextBuilder()
 
         always_display_count = 0
         for name, context_item in self.context_data.items():
@@ -240,7 +288,7 @@ class BaseAgentSystem:
 
             if name == "Context Dump" and not status_info:
                 context_item_str = f"# **{name}**:\n"
-                remaining_context = config.max_context_tokens - count_context_length(context_data_str)
+                remaining_context = config.max_context_tokens - context_builder.token_count
                 context_item_str += f"{self.get_context_dump(remaining_context, agent)}\n---\n"
             elif name == "Context Dump" and status_info:
                 continue
@@ -256,13 +304,14 @@ class BaseAgentSystem:
 
 
             if context_item["always_display"]:
-                context_data_str += context_item_str
+                context_builder.append(context_item_str)
                 always_display_count -= 1
-            elif (count_context_length(context_data_str) +
-                  count_context_length(context_item_str) +
-                  (config.max_generic_content_length * always_display_count)) < config.max_context_tokens:
-                context_data_str += context_item_str
-                self._tmp_context_data_str += context_data_str
+            else:
+                context_item_tokens = context_builder.count(context_item_str)
+                if (context_builder.tokens_if_appended(context_item_str, context_item_tokens) +
+                        (config.max_generic_content_length * always_display_count)) < config.max_context_tokens:
+                    context_builder.append(context_item_str, context_item_tokens)
+                    self._tmp_context_data_str += str(context_builder)
 
             if not status_info:
                 context_item["last_interaction"] += 1
@@ -270,7 +319,7 @@ class BaseAgentSystem:
                 if context_item["last_interaction"] > 10 and not context_item["always_display"]:
                     self.context_data.pop(name)
 
-        return context_data_str
+        return str(context_builder)
 
     def get_xml_short_memory(self):
         short_memory = self.get_short_memory()
@@ -438,12 +487,10 @@ class BaseAgentSystem:
                              self.long_term_memory_collection, n_results=1)
 
     def get_available_document_filepaths_str(self):
-        all_files = ""
-        for root, dirs, files in os.walk(self.agent_system_dir):
-            for file in files:
-                path = os.path.relpath(os.path.join(root, file), self.agent_system_dir).replace("\\", "/")
-                if path.startswith("uploads") or path.startswith("output"):
-                    all_files += f"- {path}\n"
+        if self._document_listing is None:
+            # execution snapshots are internal files of the code runs, not documents
+            self._document_listing = DirectoryListing(self.agent_system_dir, ["uploads", "output"], exclude=(SNAPSHOT_DIR,))
+        all_files = "".join(f"- {path}\n" for path in self._document_listing.get_files())
         if all_files == "":
             all_files = "*No files available*"
         return all_files
@@ -479,11 +526,8 @@ class BaseAgentSystem:
         else:
             return None
 
-    def add_message(self, sender: str, text: str,
-                    add_to_clean_chat = True,
-                    add_to_chat = True,
-                    add_to_complete_chat = False):
-
+    def store_message(self, sender: str, text: str, add_to_clean_chat, add_to_chat, add_to_complete_chat):
+        """Adds the message to the chats and returns its sender (which is "System" if the message was too long)."""
         num_tokens = count_context_length(text)
         if num_tokens > config.max_prompt_tokens:
             sender = "System"
@@ -495,9 +539,24 @@ class BaseAgentSystem:
             self.chat.add_message(sender, text)
         if add_to_complete_chat:
             self.complete_chat.add_message(sender, text)
+        return sender
+
+    def add_message(self, sender: str, text: str,
+                    add_to_clean_chat = True,
+                    add_to_chat = True,
+                    add_to_complete_chat = False):
+        sender = self.store_message(sender, text, add_to_clean_chat, add_to_chat, add_to_complete_chat)
         self.handle_message(sender)
         pass
 
+    async def async_add_message(self, sender: str, text: str,
+                                add_to_clean_chat = True,
+                                add_to_chat = True,
+                                add_to_complete_chat = False):
+        sender = self.store_message(sender, text, add_to_clean_chat, add_to_chat, add_to_complete_chat)
+        await self.async_handle_message(sender)
+        pass
+
     def add_code(self, code):
         self.code_manager.append(code)
         pass
@@ -1,10 +1,11 @@
+import asyncio
 import base64
 import os
 
 import numpy as np
 import config
 
-from llm_functions import count_context_length, basic_prompt
+from llm_functions import count_context_length, basic_prompt_streamed, async_basic_prompt_streamed
 from tools.document_command import execute_document_command
 from agent_objs.chat import Chat
 from util import delete_directory_with_content
@@ -113,32 +114,62 @@ class LLMWrapperSystem:
         return context_data_str
 
 
-    def prompt_agent(self):
-        self.replying = True
-        entire_prompt = \
-            f"# User Prompt\n{self.chat.get_last_messages_of_sender('User')}\n---\n{self.generate_context_data()}"
-        self.prompt(entire_prompt)
+    def get_entire_prompt(self, context_data_str):
+        return f"# User Prompt\n{self.chat.get_last_messages_of_sender('User')}\n---\n{context_data_str}"
 
+    def finish_reply(self):
         self.replying = False
         _notify(f"Prompting agent `{self.get_name()}` is done with prompt")
+
+    def prompt_agent(self):
+        self.replying = True
+        self.prompt(self.get_entire_prompt(self.generate_context_data()))
+        self.finish_reply()
+        pass
+
+    async def async_prompt_agent(self):
+        self.replying = True
+        context_data_str = await asyncio.to_thread(self.generate_context_data)
+        await self.async_prompt(self.get_entire_prompt(context_data_str))
+        self.finish_reply()
         pass
 
     def prompt(self, prompt):
         try:
-            response = basic_prompt(prompt)
+            response = basic_prompt_streamed(prompt, stream_info={"agent_system": self.get_name(), "agent": "Agent"})
         except Exception as e:
-            print(f"{RED}Error in prompt:{RESET} {e} ")
-            response = "Error when attempting to prompt the LLM. Please try again."
+            response = self.get_error_response(e)
         self.chat.add_message("Agent", response)
         return None
 
+    async def async_prompt(self, prompt):
+        try:
+            response = await async_basic_prompt_streamed(prompt, stream_info={"agent_system": self.get_name(),
+                                                                              "agent": "Agent"})
+        except Exception as e:
+            response = self.get_error_response(e)
+        self.chat.add_message("Agent", response)
+        return None
+
+    @staticmethod
+    def get_error_response(e):
+        print(f"{RED}Error in prompt:{RESET} {e} ")
+        return "Error when attempting to prompt the LLM. Please try again."
+
+    def should_reply(self, sender):
+        """Whether a message of the sender starts a reply."""
+        return not self.replying and sender != "Agent" and sender != "System"
+
     def handle_message(self, sender):
-        if self.replying:
-            pass
-        elif sender != "Agent" and sender != "System":
+        if self.should_reply(sender):
             self.prompt_agent()
         pass
 
+    async def async_handle_message(self, sender):
+        if self.should_reply(sender):
+            await self.async_prompt_agent()
+        pass
+
     def upload_file(self, upload_contents, filename):
         if upload_contents is not None:
             content_type, content_string = upload_contents.split(',')
@@ -163,11 +194,8 @@ class LLMWrapperSystem:
     def get_chat(self, _):
         return self.chat
 
-    def add_message(self, sender: str, text: str,
-                    add_to_clean_chat = False,
-                    add_to_chat = True,
-                    add_to_complete_chat = False):
-
+    def store_message(self, sender: str, text: str, add_to_clean_chat, add_to_chat, add_to_complete_chat):
+        """Adds the message to the chat and returns its sender (which is "System" if the message was too long)."""
         num_tokens = count_context_length(text)
         if num_tokens > config.max_prompt_tokens:
             sender = "System"
@@ -175,9 +203,24 @@ class LLMWrapperSystem:
 
         if add_to_chat or add_to_complete_chat or add_to_clean_chat:
             self.chat.add_message(sender, text)
+        return sender
+
+    def add_message(self, sender: str, text: str,
+                    add_to_clean_chat = False,
+                    add_to_chat = True,
+                    add_to_complete_chat = False):
+        sender = self.store_message(sender, text, add_to_clean_chat, add_to_chat, add_to_complete_chat)
         self.handle_message(sender)
         pass
 
+    async def async_add_message(self, sender: str, text: str,
+                                add_to_clean_chat = False,
+                                add_to_chat = True,
+                                add_to_complete_chat = False):
+        sender = self.store_message(sender, text, add_to_clean_chat, add_to_chat, add_to_complete_chat)
+        await self.async_handle_message(sender)
+        pass
+
     def get_reply(self):
         return self.chat.get_last_messages_of_sender("Agent")
 
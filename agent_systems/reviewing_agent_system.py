@@ -20,8 +20,7 @@ class ReviewingAgentSystem(BaseAgentSystem):
         agents=[self.tinker_agent, self.critic_agent, self.summarizing_agent]
         super().__init__(system_name, description, agents)
 
-    def prompt_agent(self):
-        self.replying = True
+    def get_agent_steps(self):
         self._prompt = self.clean_chat.get_last_messages_of_sender('User')
 
         i = 0
@@ -38,7 +37,7 @@ class ReviewingAgentSystem(BaseAgentSystem):
 
             entire_prompt = \
                 f"{self._prompt}\n\n---\n\n{instructions}"
-            self.prompt(entire_prompt, self.tinker_agent)
+            yield entire_prompt, self.tinker_agent, False
 
             if not self.extraction_failure:
                 instructions = (
@@ -67,7 +66,7 @@ class ReviewingAgentSystem(BaseAgentSystem):
                 )
 
 
-                self.prompt(instructions, self.critic_agent)
+                yield instructions, self.critic_agent, False
 
                 if self.critic_agent.requirements_met:
                     break
@@ -100,13 +99,9 @@ class ReviewingAgentSystem(BaseAgentSystem):
             entire_prompt = \
                 f"{self._prompt}\n\n---\n\n{instructions}"
 
-            self.prompt(entire_prompt, self.summarizing_agent, print_thinking=i >= self.max_iterations+self.max_summarizing_iterations)
+            yield entire_prompt, self.summarizing_agent, i >= self.max_iterations+self.max_summarizing_iterations
             i += 1
 
-        self.replying = False
-        self.send_socket_message(f"Prompted agent `{self.get_name()}`. Agent has replied.")
-        pass
-
 
 class ReviewingAgentSystemWithLesserCritic(ReviewingAgentSystem):
     def __init__(self):
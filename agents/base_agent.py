@@ -1,4 +1,6 @@
-from llm_functions import basic_prompt
+import asyncio
+
+from llm_functions import basic_prompt_streamed, async_basic_prompt_streamed
 from util.colors import RED, RESET
 
 
@@ -7,7 +9,8 @@ class BaseAgent:
     The Default Agent that has all tools at its disposal.
     """
 
-    def __init__(self, system, agent_name, role, chroma_collection=None, model=None, internal_agent=True):
+    def __init__(self, system, agent_name, role, chroma_collection=None, model=None, internal_agent=True,
+                 cache_responses=False):
         """
         Initializes the BaseAgent with the given parameters.
         :param system: the agent system that this agent is part of
@@ -16,12 +19,14 @@ class BaseAgent:
         :param chroma_collection: where to get the context_dump for the agent, None means no rag
         :param model: model the agent should use. None means default model / selectable
         :param internal_agent: if the agent does not use any tools (including response)
+        :param cache_responses: if identical prompts may be answered from the response cache instead of the LLM
         """
         self.agent_name = agent_name
         self.role = role
         self.chroma_collection = chroma_collection
         self.model = model
         self.internal_agent = internal_agent
+        self.cache_responses = cache_responses
 
         self.system = system
         self.command_instructions = self.get_default_command_instructions()
@@ -44,20 +49,39 @@ class BaseAgent:
     def get_chroma_collection(self):
         return self.chroma_collection
 
+    def get_system_prompt(self):
+        """
+        Generates the static part of the prompt: the role and the tool instructions.
+        It is sent first (as system message), so providers can reuse it from their prompt cache across iterations.
+        Anything that changes between iterations (like the available documents) belongs in `get_full_prompt`.
+        :return: The system prompt for the agent.
+        """
+        return f"{self.get_role()}\n\n---\n\n{self.get_instruction_str()}"
+
     def get_full_prompt(self, prompt):
         """
-        Generates the full prompt for the agent.
+        Generates the dynamic part of the prompt, which follows the system prompt.
         :param prompt: The prompt to be sent to the agent.
         :return: The full prompt for the agent.
         """
         entire_prompt = \
-            f"{prompt}\n\n---\n\n{self.get_instruction_str()}\n\n---\n\n{self.system.generate_context_data(self)}"
+            f"{prompt}\n\n---\n\n{self.get_available_documents_str()}{self.system.generate_context_data(self)}"
         return entire_prompt
 
+    def get_available_documents_str(self, ignore_active=False):
+        """The files the `<document>` command can read, if it is available to the agent."""
+        if not (self.command_instructions["document"]["active"] or ignore_active):
+            return ""
+        return f"# Available Documents\n{self.system.get_available_document_filepaths_str()}\n\n---\n\n"
+
     def prompt(self, prompt):
+        system_prompt = self.get_system_prompt()
         entire_prompt = self.get_full_prompt(prompt)
         try:
-            response = basic_prompt(entire_prompt, self.get_role(), self.get_model())
+            response = basic_prompt_streamed(entire_prompt, system_prompt, self.get_model(),
+                                             stream_info={"agent_system": self.system.get_name(),
+                                                          "agent": self.get_name()},
+                                             use_cache=self.cache_responses)
         except Exception as e:
             print(f"{RED}Error in prompt:{RESET} {e} ")
             response = "Error when attempting to prompt the LLM. Please try again."
@@ -65,7 +89,25 @@ class BaseAgent:
         if self.internal_agent:
             self.system.use_tools(response, self)
 
-        return response, entire_prompt
+        return response, f"{system_prompt}\n\n---\n\n{entire_prompt}"
+
+    async def async_prompt(self, prompt):
+        # context generation queries the RAG-DB and tokenizes, so it is run off the event loop
+        system_prompt = await asyncio.to_thread(self.get_system_prompt)
+        entire_prompt = await asyncio.to_thread(self.get_full_prompt, prompt)
+        try:
+            response = await async_basic_prompt_streamed(entire_prompt, system_prompt, self.get_model(),
+                                                         stream_info={"agent_system": self.system.get_name(),
+                                                                      "agent": self.get_name()},
+                                                         use_cache=self.cache_responses)
+        except Exception as e:
+            print(f"{RED}Error in prompt:{RESET} {e} ")
+            response = "Error when attempting to prompt the LLM. Please try again."
+
+        if self.internal_agent:
+            await self.system.async_use_tools(response, self)
+
+        return response, f"{system_prompt}\n\n---\n\n{entire_prompt}"
 
     def add_custom_command_instructions(self, name, instructions, active=True):
         self.command_instructions[name] = {"text": instructions, "active": active}
@@ -312,8 +354,8 @@ class BaseAgent:
                 "text": (
                     "## **Project Documents (`<document>`)**\n"
                     "Throughout this project, several documents will be created and stored. You can query these documents using the `<document>` tag.\n"
-                    "As an attribute, you will need to append the document path. Here is a list of available documents:\n"
-                    "{dynamic_info}\n"  # Placeholder for dynamic content
+                    "As an attribute, you will need to append the document path. "
+                    "The available documents are listed in the prompt under `# Available Documents`.\n"
                     "\n"
                     "Here is an example of how to query a document:\n"
                     "```xml\n"
@@ -322,7 +364,6 @@ class BaseAgent:
                     "Please ensure to add the entire path to the document in the pseudo XML.\n"
                     "*Important:* When this command is used it is impossible to reply to the user at the same time as you will have to wait for the results.\n\n"
                 ),
-                "dynamic_data": self.system.get_available_document_filepaths_str,
                 "active": True
             },
         }
\ No newline at end of file
@@ -19,15 +19,26 @@ class CriticAgent(BaseAgent):
 
     def prompt(self, prompt):
         response, prompt = super().prompt(prompt)
+        self.evaluate_response(response)
+        return response, prompt
+
+    async def async_prompt(self, prompt):
+        response, prompt = await super().async_prompt(prompt)
+        self.evaluate_response(response)
+        return response, prompt
+
+    def evaluate_response(self, response):
         if "<Yes>" in response or "<yes>" in response:
             self.requirements_met = True
         else:
             self.requirements_met = False
-        return response, prompt
+
+    def get_system_prompt(self):
+        return (f"{self.get_role()}\n\n---\n\n"
+                f"**Here are the Instructions for reference, but they can not be used in this prompt:**\n{self.get_instruction_str(ignore_active=True)}\n\n")
 
     def get_full_prompt(self, prompt):
         entire_prompt = \
-            (f"{prompt}\n\n---\n\n{self.system.generate_context_data(self, status_info=True)}\n\n"
-             f"---\n\n"
-             f"**Here are the Instructions for reference, but they can not be used in this prompt:**\n{self.get_instruction_str(ignore_active=True)}\n\n")
+            (f"{prompt}\n\n---\n\n{self.get_available_documents_str(ignore_active=True)}"
+             f"{self.system.generate_context_data(self, status_info=True)}\n\n")
         return entire_prompt
@@ -1,13 +1,15 @@
 import datetime
 import os
-import threading
 from flask_socketio import SocketIO
 from flask import Flask, jsonify, request, send_file
 
 import agent_manager
-from agent_objs import chat, code_manager
+import config
+from agent_objs import chat, code, code_manager
 from agent_systems import base_agent_system, llm_wrapper_system
-from util import decode_url_str
+from llm_functions import llm_api_wrapper
+from util import decode_url_str, async_runtime
+from util.job_scheduler import JobScheduler, JobQueueFull
 app = Flask(__name__)
 
 async_mode = os.getenv("ASYNC_MODE",'eventlet')  # Use eventlet for async mode only when deployed add env variable with "threading" as value in IDE
@@ -16,6 +18,8 @@ socketio = SocketIO(app, logger=True, engineio_logger=True,
                     async_mode=async_mode,
                     cors_allowed_origins="*") # Initialize SocketIO with Flask
 
+job_scheduler = JobScheduler(config.JOB_WORKERS, config.JOB_QUEUE_MAX_DEPTH, config.JOB_HISTORY_SIZE)
+
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
@@ -31,6 +35,18 @@ def send_message(message, event="message"):
     except Exception as e:
         print(f"Error emitting SocketIO message: {e}")
 
+def send_stream_event(payload):
+    try:
+        socketio.emit("agent_stream", payload, namespace='/')
+    except Exception as e:
+        print(f"Error emitting SocketIO stream event: {e}")
+
+def send_code_output(payload):
+    try:
+        socketio.emit("code_output", payload, namespace='/')
+    except Exception as e:
+        print(f"Error emitting SocketIO code output: {e}")
+
 @app.route('/get_agents', methods=['GET'])
 def get_agents():
     agents = agent_manager.get_agents()
@@ -75,13 +91,42 @@ def add_message(url_agent_name):
     try:
         agent_name = decode_url_str(url_agent_name)
         agent = agent_manager.get_agent(agent_name)
-        if agent:
-            threading.Thread(target=agent.add_message, args=('User', data['text'])).start()
+        if agent and config.AGENT_EXECUTION_MODE == "async":
+            job = job_scheduler.submit(str(agent), run_async_add_message, agent, 'User', data['text'])
+        elif agent:
+            job = job_scheduler.submit(str(agent), agent.add_message, 'User', data['text'])
         else:
             return jsonify({'error': f'Agent `{agent_name}` not found'}), 404
     except KeyError as e:
         return jsonify({'error': f'Missing key: {e}'}), 400
-    return jsonify({'message': 'Message added'})
+    except JobQueueFull as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(config.JOB_RETRY_AFTER)}
+    return jsonify({'message': 'Message added', 'job_id': job.job_id})
+
+def run_async_add_message(agent, sender, text):
+    # the job scheduler frees its worker right away and finishes the job once the future is done
+    return async_runtime.submit(agent.async_add_message(sender, text))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_scheduler.get(job_id)
+    if job:
+        return jsonify(job.to_dict())
+    return jsonify({'error': f'Job `{job_id}` not found'}), 404
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_scheduler.get(job_id)
+    if not job:
+        return jsonify({'error': f'Job `{job_id}` not found'}), 404
+    if job_scheduler.cancel(job_id):
+        return jsonify({'message': f'Job `{job_id}` cancelled'})
+    return jsonify({'error': f'Job `{job_id}` is {job.status} and can no longer be cancelled'}), 409
+
+@app.route('/<url_agent_name>/jobs', methods=['GET'])
+def get_jobs(url_agent_name):
+    agent_name = decode_url_str(url_agent_name)
+    return jsonify([job.to_dict() for job in job_scheduler.get_jobs_of_agent_system(agent_name)])
 
 @app.route('/<url_agent_name>/get_chat_history/<url_chat_name>', methods=['GET'])
 def get_chat_history(url_agent_name, url_chat_name):
@@ -90,8 +135,15 @@ def get_chat_history(url_agent_name, url_chat_name):
     agent = agent_manager.get_agent(agent_name)
     if agent:
         chat = agent.get_chat(chat_name)
-        if chat:
-            return jsonify(chat)
+        if chat is not None and request.if_none_match.contains(chat.get_etag()):
+            return '', 304, {'ETag': f'"{chat.get_etag()}"'}
+
+        if chat is not None and any(arg in request.args for arg in ('since', 'limit', 'cursor')):
+            return get_chat_history_page(chat)
+        elif chat:
+            response = jsonify(chat)
+            response.set_etag(chat.get_etag())
+            return response
         elif isinstance(chat, object):
             return jsonify({'warning': f'Chat `{chat_name}` is empty'}), 200
         else:
@@ -99,6 +151,35 @@ def get_chat_history(url_agent_name, url_chat_name):
     else:
         return jsonify({'error': f'Agent `{agent_name}` not found'}), 404
 
+def get_chat_history_page(chat):
+    """
+    Returns only part of a chat: the messages from `cursor` (as returned by a previous page) or from the seq `since`,
+    at most `limit` of them. If the cursor belongs to a chat that has been cleared in the meantime, the history is
+    returned from the start and `reset` is set.
+    """
+    reset = False
+    try:
+        if 'cursor' in request.args:
+            since = chat.parse_cursor(request.args['cursor'])
+            if since is None:
+                since = 0
+                reset = True
+        else:
+            since = int(request.args.get('since', 0))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+    except ValueError:
+        return jsonify({'error': 'Invalid `since` or `limit` parameter'}), 400
+
+    messages = chat.get_messages(since, limit)
+    response = jsonify({
+        'messages': messages,
+        'next_cursor': chat.get_cursor(since + len(messages)),
+        'total': len(chat),
+        'reset': reset,
+    })
+    response.set_etag(chat.get_etag())
+    return response
+
 @app.route('/<url_agent_name>/get_chats', methods=['GET'])
 def get_chats(url_agent_name):
     agent = decode_url_str(url_agent_name)
@@ -111,7 +192,8 @@ def get_dashboard(url_agent_name):
     agent = agent_manager.get_agent(agent)
     code_obj = agent.get_frontend_code()
     if code_obj:
-        return jsonify(code_obj.get_execution_code())
+        # the full source, restoring snapshots only works next to this server's output/
+        return jsonify(code_obj.get_execution_code(use_snapshots=False))
     return jsonify({'error': 'No frontend code found'}), 404
 
 @app.route('/<url_agent_name>/get_code/<url_code_name>', methods=['GET'])
@@ -200,6 +282,8 @@ chat.register_message_callback(send_message)
 code_manager.register_message_callback(send_message)
 base_agent_system.register_message_callback(send_message)
 llm_wrapper_system.register_message_callback(send_message)
+llm_api_wrapper.register_stream_callback(send_stream_event)
+code.register_output_callback(send_code_output)
 
 if __name__ == '__main__':
     app.run(debug=False)
\ No newline at end of file
@@ -41,7 +41,7 @@ max_tokens = {
     "gpt-5-mini": 400_000,
     "gpt-5-nano": 400_000,
     # ---
-    "text-embedding-ada-002": 8192,
+    "text-embedding-ada-002": 8191,
     # Google
     "gemini-2.5-pro-preview-03-25": 1_000_000,
     "gemini-2.5-flash-preview-04-17": 1_000_000,
@@ -84,6 +84,69 @@ top_k = 3
 long_memory_display = True
 
 RAG_CHUNK_SIZE = 8192
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma") # "chroma" (remote server) or "local" (in-process)
+LOCAL_VECTOR_STORE_DIR = "vector_store"
+LOCAL_VECTOR_IVF_MIN_SIZE = 20_000 # smaller local collections are searched brute-force
+LOCAL_VECTOR_IVF_NPROBE = 8 # clusters scanned per query of the inverted-file index
+RAG_HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() == "true" # fuse BM25 keyword and vector results
+BM25_INDEX_DIR = "bm25_index"
+HYBRID_CANDIDATE_FACTOR = 4 # each retriever contributes n_results * factor candidates to the fusion
+RRF_K = 60 # rank offset of reciprocal-rank fusion
+CHROMA_COUNT_TTL = 30 # seconds a counted collection size is reused
+CHROMA_MAX_RETRIES = 3 # reconnect attempts when the connection to Chroma breaks
+EMBEDDING_CACHE_SIZE = 1024 # query embeddings kept in memory
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR") # on-disk embedding cache, disabled if unset
+EMBEDDING_CACHE_DISK_MAX_ROWS = 100_000
+INGEST_BATCH_SIZE = 256 # chunks per embeddings request and upsert
+INGEST_BATCH_MAX_TOKENS = 250_000 # tokens per embeddings request, below the API limit of 300k
+INGEST_WORKERS = 4
+INGEST_MAX_RETRIES = 5
+INGEST_PROGRESS_DIR = "ingest_progress" # finished batches per collection, to resume interrupted ingestion
+
+# Token counting
+TOKEN_COUNT_CACHE_SIZE = 4096 # number of (model, content hash) entries kept in the LRU cache
+GEMINI_CHARS_PER_TOKEN = 4.0 # starting ratio of the local Gemini estimator, calibrated at runtime
+TOKEN_COUNT_VALIDATION_RATE = 0.02 # share of Gemini counts validated against the remote count_tokens endpoint
+TOKEN_COUNT_CALIBRATION_WEIGHT = 0.2 # weight of a remote sample when updating the Gemini estimator
+TOKEN_COUNT_CALIBRATION_QUEUE_SIZE = 8 # pending Gemini validation samples, further samples are dropped
+
+# LLM provider clients (one pooled client per provider, key and base url)
+LLM_MAX_CONNECTIONS = 50
+LLM_MAX_KEEPALIVE_CONNECTIONS = 20
+LLM_KEEPALIVE_EXPIRY = 60.0 # seconds an idle connection is kept alive
+
+# Provider prompt caching of the static system prompt (role and tool instructions) of agents
+GEMINI_CONTEXT_CACHING = True # OpenAI caches prompt prefixes automatically, Gemini needs explicit cached contents
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = 4096 # shorter system prompts are sent inline, the API rejects small caches
+GEMINI_CONTEXT_CACHE_TTL = 3600 # seconds
+GEMINI_CONTEXT_CACHE_MAX_ENTRIES = 16 # cached contents kept alive at a time, the oldest are deleted
+
+# LLM response cache (used by agents created with cache_responses=True)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_FILE = os.path.abspath(os.getenv("RESPONSE_CACHE_FILE", "agent_files/response_cache.sqlite3"))
+RESPONSE_CACHE_TTL = 24 * 60 * 60 # seconds a response may be reused
+RESPONSE_CACHE_SIZE = 256 # responses kept in memory
+RESPONSE_CACHE_DISK_SIZE = 10_000 # responses kept on disk, least recently used ones are dropped first
+RESPONSE_CACHE_SEMANTIC = False # also reuse responses of near-identical prompts (costs one embedding per prompt)
+RESPONSE_CACHE_SIMILARITY = 0.98 # minimal cosine similarity of prompt embeddings for a semantic hit
+
+# Agent execution: "thread" (one thread per message) or "async" (all sessions on one asyncio event loop)
+AGENT_EXECUTION_MODE = os.getenv("AGENT_EXECUTION_MODE", "thread")
+ASYNC_RUNTIME_MAX_BLOCKING_WORKERS = 16 # threads for blocking libraries (Chroma, Docker) used by the async runtime
+
+# Tool commands of a single agent response
+COMMAND_WORKERS = 4 # read-only commands (query, document) that run at the same time
+
+# Job scheduling of incoming messages
+JOB_WORKERS = 4 # agent systems that can work on a message at the same time
+JOB_QUEUE_MAX_DEPTH = 32 # messages that may wait, further ones are rejected with HTTP 429
+JOB_HISTORY_SIZE = 1000 # finished jobs whose status can still be looked up
+JOB_RETRY_AFTER = 5 # seconds suggested to clients whose message was rejected
+
+# Chat persistence
+CHAT_STORE_BACKEND = os.getenv("CHAT_STORE_BACKEND", "journal") # "journal" (append-only JSONL) or "sqlite"
+CHAT_JOURNAL_FSYNC_EVERY = 16 # fsync the chat journal after this many unsynced messages
+CHAT_JOURNAL_FSYNC_INTERVAL = 2.0 # or when this many seconds passed since the last fsync
 
 DEBUG = os.getenv("DEBUG", False)
 
@@ -1,2 +1,2 @@
 from .llm_util import count_context_length, is_context_too_long
-from .llm_api_wrapper import basic_prompt
\ No newline at end of file
+from .llm_api_wrapper import basic_prompt, basic_prompt_streamed, async_basic_prompt, async_basic_prompt_streamed
\ No newline at end of file
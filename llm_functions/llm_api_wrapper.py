@@ -3,23 +3,63 @@ import base64
 import io
 import os
 import time
+import uuid
 import google
 import openai
 from PIL import Image
 from google import genai
-from openai import OpenAI
 
 import config
+from llm_functions import response_cache
+from llm_functions.llm_clients import get_openai_client, get_genai_client, get_async_openai_client
 from llm_functions.llm_util import is_context_too_long
+from llm_functions.prompt_cache import get_gemini_request, invalidate_gemini_cached_content
 from scrt import OPENAI_KEY, GOOGLE_KEY, LAMBDA_KEY
 
 from config import DEBUG
 from util.colors import PINK, RESET, BLUE, GREEN
 
-def basic_prompt(prompt: str, role: str = "You are a helpful assistant.", model=None) -> str:
+LAMBDA_API_BASE = "https://api.lambda.ai/v1"
+
+_stream_callback = None
+
+def register_stream_callback(callback_func):
+    """Registers a function to be called with every streamed completion delta."""
+    global _stream_callback
+    _stream_callback = callback_func
+
+def _notify_stream(payload: dict):
+    """Internal helper to safely call the registered stream callback."""
+    if _stream_callback:
+        try:
+            _stream_callback(payload)
+        except Exception as e:
+            print(f"Error in stream callback: {e}")
+
+def _get_cached_response(prompt: str, role: str, model: str, use_cache: bool):
+    if not use_cache or not config.RESPONSE_CACHE_ENABLED:
+        return None
+    response = response_cache.get(prompt, role, model)
+    if response is not None and DEBUG:
+        print(f"--------Cached response of Model: {model}-------------")
+    return response
+
+def _cache_response(prompt: str, role: str, model: str, response: str, use_cache: bool):
+    if use_cache and config.RESPONSE_CACHE_ENABLED:
+        response_cache.put(prompt, role, model, response)
+
+def basic_prompt(prompt: str, role: str = "You are a helpful assistant.", model=None, use_cache: bool = False) -> str:
+    """
+    :param use_cache: reuse the response of an identical (or, with RESPONSE_CACHE_SEMANTIC, near-identical) earlier
+        prompt to the same model and role, see `llm_functions.response_cache`
+    """
     if model is None:
         model = config.selected_model
 
+    cached_response = _get_cached_response(prompt, role, model, use_cache)
+    if cached_response is not None:
+        return cached_response
+
     if DEBUG:
         print(f"--------Invoking Model: {model}-------------")
         # print(f"{PINK}ROLE:\n{role}{RESET}")
@@ -32,6 +72,7 @@ def basic_prompt(prompt: str, role: str = "You are a helpful assistant.", model=
     else:
         response = _basic_prompt_lambda(prompt, role, model)
 
+    _cache_response(prompt, role, model, response, use_cache)
 
     if DEBUG:
         print(f"{GREEN}RESPONSE:\n{response}{RESET}")
@@ -40,19 +81,13 @@ def basic_prompt(prompt: str, role: str = "You are a helpful assistant.", model=
 
 
 def _basic_prompt_lambda(prompt: str, role: str, model: str) -> str:
-    lambda_api_key = LAMBDA_KEY
-    lambda_api_base = "https://api.lambda.ai/v1"
-
     try:
         if is_context_too_long(prompt, model):
             raise ValueError("Prompt exceeds the maximum token limit.")
     except ValueError as e:
         print(f"Warning: {e}")
 
-    client = OpenAI(
-        api_key=lambda_api_key,
-        base_url=lambda_api_base,
-    )
+    client = get_openai_client(LAMBDA_KEY, LAMBDA_API_BASE)
 
     response_text = client.chat.completions.create(
         messages=[
@@ -69,7 +104,7 @@ def _basic_prompt_lambda(prompt: str, role: str, model: str) -> str:
 
 
 def _basic_prompt_openai(prompt: str, role: str, model: str) -> str:
-    openai.api_key = OPENAI_KEY
+    client = get_openai_client(OPENAI_KEY)
 
     try:
         if is_context_too_long(prompt, model):
@@ -77,19 +112,10 @@ def _basic_prompt_openai(prompt: str, role: str, model: str) -> str:
     except ValueError as e:
         print(f"Warning: {e}")
 
-    reasoning_effort = None
-    if model.endswith("-high"):
-        reasoning_effort = "high"
-        model = model[:-5]  # Remove "-high" suffix
-    elif model.endswith("-medium"):
-        reasoning_effort = "medium"
-        model = model[:-7]
-    elif model.endswith("-low"):
-        reasoning_effort = "low"
-        model = model[:-4]
+    model, reasoning_effort = _split_reasoning_effort(model)
 
     if reasoning_effort:
-        response_text = openai.chat.completions.create(
+        response_text = client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": role},
@@ -101,7 +127,7 @@ def _basic_prompt_openai(prompt: str, role: str, model: str) -> str:
             reasoning_effort=reasoning_effort
         )
     else:
-        response_text = openai.chat.completions.create(
+        response_text = client.chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": role},
@@ -111,13 +137,28 @@ def _basic_prompt_openai(prompt: str, role: str, model: str) -> str:
                 }
             ]
         )
+    if DEBUG and response_text.usage and response_text.usage.prompt_tokens_details:
+        # prompts sharing the static system prefix are served from OpenAI's automatic prompt cache
+        print(f"Cached prompt tokens: {response_text.usage.prompt_tokens_details.cached_tokens}"
+              f"/{response_text.usage.prompt_tokens}")
     return response_text.choices[0].message.content
 
-def _basic_prompt_gemini(prompt: str, role: str, model: str) -> str:
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
+def _split_reasoning_effort(model: str):
+    """Splits a model name like `o4-mini-high` into the OpenAI model and its reasoning effort."""
+    reasoning_effort = None
+    if model.endswith("-high"):
+        reasoning_effort = "high"
+        model = model[:-5]  # Remove "-high" suffix
+    elif model.endswith("-medium"):
+        reasoning_effort = "medium"
+        model = model[:-7]
+    elif model.endswith("-low"):
+        reasoning_effort = "low"
+        model = model[:-4]
+    return model, reasoning_effort
 
-    client = genai.Client(api_key=GOOGLE_KEY)
+def _basic_prompt_gemini(prompt: str, role: str, model: str) -> str:
+    client = get_genai_client(GOOGLE_KEY)
     # Add the role to the prompt for context
     role_prompt = f"TASK: {role} \n---\nPROMPT: {prompt}"
 
@@ -127,32 +168,50 @@ def _basic_prompt_gemini(prompt: str, role: str, model: str) -> str:
     except ValueError as e:
         print(f"Warning: {e}")
 
+    # the role (with the static agent instructions) goes first, as cached content if possible
+    contents, generate_config = get_gemini_request(client, prompt, role, model)
     while True:
         try:
             response = client.models.generate_content(
                 model=model,
-                contents=role_prompt,
+                contents=contents,
+                config=generate_config,
             )
             break  # Exit the loop if the request is successful
         except genai.errors.ClientError as e:
             if e.code == 429:
-                print("The search for the retry delay:")
-                print(e)
-                try:
-                    str_e = str(e)
-                    retry_delay = None
-                    for i in range(len(str_e)):
-                        if not str_e[len(str_e)-7+i :-6 + i].isdigit():
-                            retry_delay = int(str_e[len(str_e)-7+i:-6 + i])
-                            break
-                    print(f"Quota exceeded. Retrying in {retry_delay} seconds...")
-                except Exception:
+                retry_delay = _parse_gemini_retry_delay(e)
+                if retry_delay is None:
                     return f"Error: Quota exceeded and unable to parse retry delay. {e}"
-
                 time.sleep(retry_delay)
+            elif generate_config is not None:
+                # the cached content may have expired early, send the role inline instead
+                invalidate_gemini_cached_content(generate_config.cached_content)
+                contents, generate_config = role_prompt, None
             else:
                 return f"Error: Quota exceeded {e}"
 
+    return _extract_gemini_text(response)
+
+
+def _parse_gemini_retry_delay(e):
+    """Returns the retry delay (in seconds) the Gemini API asked for in a 429 error, or None."""
+    print("The search for the retry delay:")
+    print(e)
+    try:
+        str_e = str(e)
+        retry_delay = None
+        for i in range(len(str_e)):
+            if not str_e[len(str_e)-7+i :-6 + i].isdigit():
+                retry_delay = int(str_e[len(str_e)-7+i:-6 + i])
+                break
+        print(f"Quota exceeded. Retrying in {retry_delay} seconds...")
+        return retry_delay
+    except Exception:
+        return None
+
+
+def _extract_gemini_text(response) -> str:
     # Error handling (good practice)
     if not response.candidates:
         # Handle cases where the API returns no candidates (e.g., safety blocks)
@@ -176,6 +235,258 @@ def _basic_prompt_gemini(prompt: str, role: str, model: str) -> str:
             return "Error: Could not parse response."
 
 
+def stream_prompt(prompt: str, role: str = "You are a helpful assistant.", model=None):
+    """
+    Like `basic_prompt`, but yields the completion as text deltas while it is being generated.
+    """
+    if model is None:
+        model = config.selected_model
+
+    if DEBUG:
+        print(f"--------Invoking Model (streaming): {model}-------------")
+
+    if model in config.MODEL_OWNER["google"]:
+        yield from _stream_prompt_gemini(prompt, role, model)
+    elif model in config.MODEL_OWNER["openai"]:
+        yield from _stream_prompt_openai(prompt, role, model)
+    else:
+        yield from _stream_prompt_lambda(prompt, role, model)
+
+
+def _stream_openai_compatible(client, prompt: str, role: str, model: str, **kwargs):
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": role},
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        stream=True,
+        **kwargs
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def _stream_prompt_lambda(prompt: str, role: str, model: str):
+    client = get_openai_client(LAMBDA_KEY, LAMBDA_API_BASE)
+    yield from _stream_openai_compatible(client, prompt, role, model)
+
+
+def _stream_prompt_openai(prompt: str, role: str, model: str):
+    client = get_openai_client(OPENAI_KEY)
+    model, reasoning_effort = _split_reasoning_effort(model)
+    if reasoning_effort:
+        yield from _stream_openai_compatible(client, prompt, role, model, reasoning_effort=reasoning_effort)
+    else:
+        yield from _stream_openai_compatible(client, prompt, role, model)
+
+
+def _stream_prompt_gemini(prompt: str, role: str, model: str):
+    client = get_genai_client(GOOGLE_KEY)
+    contents, generate_config = get_gemini_request(client, prompt, role, model)
+    for chunk in client.models.generate_content_stream(model=model, contents=contents, config=generate_config):
+        if chunk.text:
+            yield chunk.text
+
+
+def basic_prompt_streamed(prompt: str, role: str = "You are a helpful assistant.", model=None,
+                          stream_info: dict = None, use_cache: bool = False) -> str:
+    """
+    Streams the completion, forwards every delta to the registered stream callback
+    (as `{"stream_id", "delta", "done", **stream_info}`) and returns the full text once it is complete.
+    Falls back to `basic_prompt` if no stream callback is registered or the stream fails before the first delta.
+    A cached response is sent as a single, final delta.
+    """
+    if _stream_callback is None:
+        return basic_prompt(prompt, role, model, use_cache=use_cache)
+    if model is None:
+        model = config.selected_model
+
+    stream_id = uuid.uuid4().hex
+    stream_info = stream_info or {}
+    cached_response = _get_cached_response(prompt, role, model, use_cache)
+    if cached_response is not None:
+        _notify_stream({"stream_id": stream_id, "delta": cached_response, "done": True, **stream_info})
+        return cached_response
+
+    deltas = []
+    try:
+        for delta in stream_prompt(prompt, role, model):
+            deltas.append(delta)
+            _notify_stream({"stream_id": stream_id, "delta": delta, "done": False, **stream_info})
+    except Exception as e:
+        if deltas:
+            raise
+        print(f"{PINK}Streaming failed, falling back to a regular prompt: {e}{RESET}")
+        response = basic_prompt(prompt, role, model, use_cache=use_cache)
+        _notify_stream({"stream_id": stream_id, "delta": response, "done": True, **stream_info})
+        return response
+
+    _notify_stream({"stream_id": stream_id, "delta": "", "done": True, **stream_info})
+    response = "".join(deltas)
+    _cache_response(prompt, role, model, response, use_cache)
+    if DEBUG:
+        print(f"{GREEN}RESPONSE:\n{response}{RESET}")
+        print(f"---")
+    return response
+
+
+
+async def async_basic_prompt(prompt: str, role: str = "You are a helpful assistant.", model=None,
+                             use_cache: bool = False) -> str:
+    """
+    Asyncio-native variant of `basic_prompt`. Has to be awaited on the agent runtime's event loop
+    (see `util.async_runtime`), as the async provider clients are bound to it.
+    """
+    if model is None:
+        model = config.selected_model
+
+    cached_response = await asyncio.to_thread(_get_cached_response, prompt, role, model, use_cache)
+    if cached_response is not None:
+        return cached_response
+
+    if DEBUG:
+        print(f"--------Invoking Model (async): {model}-------------")
+
+    if model in config.MODEL_OWNER["google"]:
+        response = await _async_basic_prompt_gemini(prompt, role, model)
+    elif model in config.MODEL_OWNER["openai"]:
+        # `model` stays the full name (e.g. "o4-mini-high"), it is the key of the response cache
+        base_model, reasoning_effort = _split_reasoning_effort(model)
+        kwargs = {"reasoning_effort": reasoning_effort} if reasoning_effort else {}
+        response = await _async_basic_prompt_openai_compatible(get_async_openai_client(OPENAI_KEY),
+                                                               prompt, role, base_model, **kwargs)
+    else:
+        response = await _async_basic_prompt_openai_compatible(get_async_openai_client(LAMBDA_KEY, LAMBDA_API_BASE),
+                                                               prompt, role, model)
+
+    await asyncio.to_thread(_cache_response, prompt, role, model, response, use_cache)
+
+    if DEBUG:
+        print(f"{GREEN}RESPONSE:\n{response}{RESET}")
+        print(f"---")
+    return response
+
+
+async def _async_basic_prompt_openai_compatible(client, prompt: str, role: str, model: str, **kwargs) -> str:
+    response_text = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": role},
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        **kwargs
+    )
+    return response_text.choices[0].message.content
+
+
+async def _async_basic_prompt_gemini(prompt: str, role: str, model: str) -> str:
+    client = get_genai_client(GOOGLE_KEY)
+    role_prompt = f"TASK: {role} \n---\nPROMPT: {prompt}"
+    contents, generate_config = await asyncio.to_thread(get_gemini_request, client, prompt, role, model)
+
+    while True:
+        try:
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=generate_config,
+            )
+            break
+        except genai.errors.ClientError as e:
+            if e.code == 429:
+                retry_delay = _parse_gemini_retry_delay(e)
+                if retry_delay is None:
+                    return f"Error: Quota exceeded and unable to parse retry delay. {e}"
+                await asyncio.sleep(retry_delay)
+            elif generate_config is not None:
+                invalidate_gemini_cached_content(generate_config.cached_content)
+                contents, generate_config = role_prompt, None
+            else:
+                return f"Error: Quota exceeded {e}"
+
+    return _extract_gemini_text(response)
+
+
+async def async_stream_prompt(prompt: str, role: str = "You are a helpful assistant.", model=None):
+    """Asyncio-native variant of `stream_prompt`."""
+    if model is None:
+        model = config.selected_model
+
+    if model in config.MODEL_OWNER["google"]:
+        client = get_genai_client(GOOGLE_KEY)
+        contents, generate_config = await asyncio.to_thread(get_gemini_request, client, prompt, role, model)
+        async for chunk in await client.aio.models.generate_content_stream(model=model, contents=contents,
+                                                                            config=generate_config):
+            if chunk.text:
+                yield chunk.text
+        return
+
+    if model in config.MODEL_OWNER["openai"]:
+        client = get_async_openai_client(OPENAI_KEY)
+        model, reasoning_effort = _split_reasoning_effort(model)
+        kwargs = {"reasoning_effort": reasoning_effort} if reasoning_effort else {}
+    else:
+        client = get_async_openai_client(LAMBDA_KEY, LAMBDA_API_BASE)
+        kwargs = {}
+
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": role},
+            {
+                "role": "user",
+                "content": prompt,
+            }
+        ],
+        stream=True,
+        **kwargs
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def async_basic_prompt_streamed(prompt: str, role: str = "You are a helpful assistant.", model=None,
+                                      stream_info: dict = None, use_cache: bool = False) -> str:
+    """Asyncio-native variant of `basic_prompt_streamed`."""
+    if _stream_callback is None:
+        return await async_basic_prompt(prompt, role, model, use_cache=use_cache)
+    if model is None:
+        model = config.selected_model
+
+    stream_id = uuid.uuid4().hex
+    stream_info = stream_info or {}
+    cached_response = await asyncio.to_thread(_get_cached_response, prompt, role, model, use_cache)
+    if cached_response is not None:
+        _notify_stream({"stream_id": stream_id, "delta": cached_response, "done": True, **stream_info})
+        return cached_response
+
+    deltas = []
+    try:
+        async for delta in async_stream_prompt(prompt, role, model):
+            deltas.append(delta)
+            _notify_stream({"stream_id": stream_id, "delta": delta, "done": False, **stream_info})
+    except Exception as e:
+        if deltas:
+            raise
+        print(f"{PINK}Streaming failed, falling back to a regular prompt: {e}{RESET}")
+        response = await async_basic_prompt(prompt, role, model, use_cache=use_cache)
+        _notify_stream({"stream_id": stream_id, "delta": response, "done": True, **stream_info})
+        return response
+
+    _notify_stream({"stream_id": stream_id, "delta": "", "done": True, **stream_info})
+    response = "".join(deltas)
+    await asyncio.to_thread(_cache_response, prompt, role, model, response, use_cache)
+    return response
+
 
 def get_image_description(
         image_path: str,
@@ -261,8 +572,8 @@ def get_image_description_openai(
 
     # --- API Call ---
     try:
-        openai.api_key = OPENAI_KEY
-        response = openai.chat.completions.create(
+        client = get_openai_client(OPENAI_KEY)
+        response = client.chat.completions.create(
             model=model_name,
             messages=messages,
             max_tokens=300
@@ -301,17 +612,14 @@ def get_image_description_gemini(
     if not os.path.exists(image_path):
         return f"Error: Image file not found at {image_path}"
 
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-
     if DEBUG:
         print(f"{BLUE}--- Invoking Vision Model: {model_name} ---{RESET}")
         # print(f"Image Path: {image_path}")
         # print(f"Text Prompt: {text_prompt}")
 
     try:
-        # Configure the API client
-        client = genai.Client(api_key=GOOGLE_KEY)
+        # Get the shared API client
+        client = get_genai_client(GOOGLE_KEY)
 
         # Load the image using Pillow for validation and compatibility
         try:
@@ -411,7 +719,7 @@ if __name__ == "__main__":
         evaluation_string += f"--------------{model_name}----------------\n"
         import agent_manager
         agent_manager.set_model(model_name)
-        response = basic_prompt(prompt.format(dynamic_content=question), role)
+        response = basic_prompt(prompt.format(dynamic_content=question), role, use_cache=True)
 
         try:
             answer = response.split("<answer>")[1].split("</answer>")[0]
@@ -0,0 +1,91 @@
+import asyncio
+import atexit
+import threading
+
+import httpx
+import openai
+from google import genai
+
+import config
+
+# --- Registry of long-lived provider clients, keyed by (provider, api key, base url) ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def ensure_event_loop():
+    """The genai client expects an event loop in the calling thread. Creates one only if the thread has none."""
+    try:
+        asyncio.get_event_loop()
+    except RuntimeError:
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
+
+def _get_or_create_client(key, create_client):
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = create_client()
+        return _clients[key]
+
+
+def get_openai_client(api_key: str, base_url: str = None) -> openai.OpenAI:
+    """
+    Returns the shared OpenAI (or OpenAI-compatible) client for the key and base url.
+    The client is thread-safe and keeps its connections alive across calls.
+    """
+    def create_client():
+        http_client = openai.DefaultHttpxClient(
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+            )
+        )
+        return openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    return _get_or_create_client(("openai", api_key, base_url), create_client)
+
+
+def get_async_openai_client(api_key: str, base_url: str = None) -> openai.AsyncOpenAI:
+    """
+    Returns the shared asyncio OpenAI (or OpenAI-compatible) client for the key and base url.
+    Its connection pool is bound to the agent runtime's event loop, so it must only be used from there.
+    """
+    def create_client():
+        http_client = openai.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.LLM_KEEPALIVE_EXPIRY,
+            )
+        )
+        return openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+
+    return _get_or_create_client(("openai-async", api_key, base_url), create_client)
+
+
+def get_genai_client(api_key: str) -> genai.Client:
+    """
+    Returns the shared Gemini client for the key, reusing its connection pool across calls.
+    google-genai 1.7 does not expose its httpx client's settings, so the pool keeps httpx's default limits.
+    """
+    ensure_event_loop()
+    return _get_or_create_client(("google", api_key, None), lambda: genai.Client(api_key=api_key))
+
+
+@atexit.register
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            if isinstance(client, openai.AsyncOpenAI):
+                continue # closed together with the event loop it is bound to
+            if isinstance(client, genai.Client):
+                continue # has no close(), its httpx clients close themselves when collected
+            try:
+                client.close()
+            except Exception:
+                pass
+        _clients.clear()
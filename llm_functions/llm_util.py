@@ -1,10 +1,15 @@
-import asyncio
+import hashlib
+import math
+import queue
+import random
+import threading
+from collections import OrderedDict
 
 import tiktoken
-from google import genai
 
 import config
 from config import max_tokens, MODEL_OWNER, DEBUG
+from llm_functions.llm_clients import get_genai_client
 from scrt import GOOGLE_KEY, HUGGING_FACE_KEY
 from util.colors import PINK, RESET
 from transformers import AutoTokenizer
@@ -59,7 +64,18 @@ def get_tokenizer(model_name):
         print(f"{PINK}No Hugging Face tokenizer mapping found for model: {model_name}{RESET}")
         return None
 
-def count_context_length(prompt: str, model: str = "default") -> int:
+# --- Content-hash LRU cache for token counts ---
+_token_count_cache = OrderedDict()
+_token_count_cache_lock = threading.Lock()
+
+# --- Calibration state of the local Gemini estimator ---
+_gemini_chars_per_token = config.GEMINI_CHARS_PER_TOKEN
+_gemini_calibration_lock = threading.Lock()
+_gemini_calibration_queue = queue.Queue(maxsize=config.TOKEN_COUNT_CALIBRATION_QUEUE_SIZE)
+_gemini_calibration_worker = None
+
+
+def _normalize_model_name(model: str) -> str:
     if model not in max_tokens.keys() or model == "default":
         model = config.selected_model
     if model.endswith("-high"):
@@ -70,24 +86,125 @@ def count_context_length(prompt: str, model: str = "default") -> int:
         model = model[:-4]
     if model.endswith("-basic"):
         model = model[:-6]
+    return model
+
+
+def _count_tokens_heuristic(prompt: str, model: str) -> int:
+    return int(len(prompt) / 4)
+
+
+def _count_tokens_openai(prompt: str, model: str) -> int:
+    encoding_name = OPENAI_ENCODING_MAP.get(model)
+    encoding = tiktoken.get_encoding(encoding_name)
+    return len(encoding.encode(prompt))
+
+
+def _count_tokens_huggingface(prompt: str, model: str) -> int:
+    tokenizer = get_tokenizer(model)
+    return len(tokenizer.encode(prompt, add_special_tokens=False))
+
+
+def _count_tokens_gemini_remote(prompt: str, model: str) -> int:
+    client = get_genai_client(GOOGLE_KEY)
+    return client.models.count_tokens(model=model, contents=prompt).total_tokens
+
+
+def _calibrate_gemini_estimator(prompt: str, model: str):
+    """Compares the local estimate against the remote count and nudges the chars/token ratio towards it."""
+    global _gemini_chars_per_token
+    try:
+        remote_tokens = _count_tokens_gemini_remote(prompt, model)
+    except Exception as e:
+        if DEBUG:
+            print(f"{PINK}Gemini token count validation failed: {e}{RESET}")
+        return
+    if remote_tokens <= 0:
+        return
+    observed_ratio = len(prompt) / remote_tokens
+    with _gemini_calibration_lock:
+        _gemini_chars_per_token += config.TOKEN_COUNT_CALIBRATION_WEIGHT * (observed_ratio - _gemini_chars_per_token)
+    if DEBUG:
+        print(f"Gemini token estimator calibrated to {_gemini_chars_per_token:.3f} chars/token "
+              f"(remote: {remote_tokens}, sample length: {len(prompt)})")
+
+
+def _calibrate_gemini_estimator_worker():
+    while True:
+        prompt, model = _gemini_calibration_queue.get()
+        _calibrate_gemini_estimator(prompt, model)
+
+
+def _submit_gemini_calibration(prompt: str, model: str):
+    """Queues a sample for the calibration worker (started on first use). Samples are dropped while the queue is full."""
+    global _gemini_calibration_worker
+    with _gemini_calibration_lock:
+        if _gemini_calibration_worker is None:
+            _gemini_calibration_worker = threading.Thread(target=_calibrate_gemini_estimator_worker,
+                                                          name="gemini-token-calibration", daemon=True)
+            _gemini_calibration_worker.start()
+    try:
+        _gemini_calibration_queue.put_nowait((prompt, model))
+    except queue.Full:
+        pass
+
+
+def _count_tokens_gemini(prompt: str, model: str) -> int:
+    """
+    Estimates Gemini token counts locally. A small sample of prompts is validated against the remote
+    count_tokens endpoint by a background worker to keep the chars/token ratio calibrated.
+    """
+    if prompt and random.random() < config.TOKEN_COUNT_VALIDATION_RATE:
+        _submit_gemini_calibration(prompt, model)
+    return math.ceil(len(prompt) / _gemini_chars_per_token)
+
+
+def _select_token_counter(model: str) -> str:
+    if model in MODEL_OWNER["google"]:
+        return "google"
+    elif model in MODEL_OWNER["openai"] and not model.startswith("gpt-5"):
+        return "openai"
+    elif model != "lfm-40b" and model not in MODEL_OWNER["openai"]:
+        return "huggingface"
+    else:
+        return "heuristic"
+
+
+# --- Registry of token counters, selected per model owner ---
+TOKEN_COUNTERS = {
+    "google": _count_tokens_gemini,
+    "openai": _count_tokens_openai,
+    "huggingface": _count_tokens_huggingface,
+    "heuristic": _count_tokens_heuristic,
+}
+
+
+def register_token_counter(name: str, counter_func):
+    """
+    Registers (or replaces) a token counter.
+    :param name: one of the counter names returned by the model selection (e.g. "google", "openai")
+    :param counter_func: callable taking (prompt, model) and returning the number of tokens
+    """
+    TOKEN_COUNTERS[name] = counter_func
+    clear_token_count_cache()
+
+
+def clear_token_count_cache():
+    with _token_count_cache_lock:
+        _token_count_cache.clear()
+
+
+def count_context_length(prompt: str, model: str = "default") -> int:
+    model = _normalize_model_name(model)
+
+    cache_key = (model, hashlib.blake2b(prompt.encode("utf-8", "surrogatepass"), digest_size=16).digest())
+    with _token_count_cache_lock:
+        num_tokens = _token_count_cache.get(cache_key)
+        if num_tokens is not None:
+            _token_count_cache.move_to_end(cache_key)
+            return num_tokens
+
     try:
-        if model in MODEL_OWNER["google"]:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-            client = genai.Client(api_key=GOOGLE_KEY)
-            num_tokens = client.models.count_tokens(
-                model=model, contents=prompt
-            ).total_tokens
-        elif model in MODEL_OWNER["openai"] and not model.startswith("gpt-5"):
-            encoding_name = OPENAI_ENCODING_MAP.get(model)
-            encoding = tiktoken.get_encoding(encoding_name)
-            num_tokens = len(encoding.encode(prompt))
-        elif model != "lfm-40b" and model not in MODEL_OWNER["openai"]:
-            tokenizer = get_tokenizer(model)
-            num_tokens = len(tokenizer.encode(prompt, add_special_tokens=False))
-        else:
-            num_tokens = int(len(prompt) / 4)
+        num_tokens = TOKEN_COUNTERS[_select_token_counter(model)](prompt, model)
     except Exception as e:
         try:
             print(f"{PINK}Tokenizer Failed, using heuristic: {e}{RESET}")
@@ -95,6 +212,11 @@ def count_context_length(prompt: str, model: str = "default") -> int:
         except Exception as e:
             print(f"{PINK}Error: {e}{RESET}")
             num_tokens = 0
+
+    with _token_count_cache_lock:
+        _token_count_cache[cache_key] = num_tokens
+        if len(_token_count_cache) > config.TOKEN_COUNT_CACHE_SIZE:
+            _token_count_cache.popitem(last=False)
     return num_tokens
 
 def model_max_context_length(model: str) -> int:
@@ -0,0 +1,107 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from google.genai import types
+
+import config
+from llm_functions.llm_util import count_context_length
+from util.colors import PINK, RESET
+
+# --- Gemini cached contents, keyed by (model, hash of the system instruction) ---
+# OpenAI caches stable prompt prefixes automatically, so only Gemini needs explicit cache handling.
+_gemini_caches = OrderedDict()  # key -> (cached content name or None if caching failed, created)
+_creation_locks = {}  # key -> lock, so a cached content is only created once at a time without blocking other keys
+_lock = threading.Lock()
+
+
+def _get_key(model: str, system_instruction: str):
+    return model, hashlib.sha256(system_instruction.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _get_valid(key):
+    """Returns the cached entry if it is still fresh, or None. Requires the lock."""
+    cached = _gemini_caches.get(key)
+    # renew caches a minute before they expire, failed attempts are retried after the TTL as well
+    if cached is not None and time.time() - cached[1] < config.GEMINI_CONTEXT_CACHE_TTL - 60:
+        _gemini_caches.move_to_end(key)
+        return cached
+    return None
+
+
+def get_gemini_cached_content(client, model: str, system_instruction: str):
+    """
+    Returns the name of a Gemini cached content holding the system instruction, creating it if needed.
+    Returns None if the instruction is too short to be cached or caching is not available for the model,
+    then the prompt has to be sent without it.
+    """
+    if not config.GEMINI_CONTEXT_CACHING:
+        return None
+    if count_context_length(system_instruction, model) < config.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+        return None
+
+    key = _get_key(model, system_instruction)
+    with _lock:
+        cached = _get_valid(key)
+        if cached is not None:
+            return cached[0]
+        creation_lock = _creation_locks.setdefault(key, threading.Lock())
+
+    # the API call is made without the global lock, requests for other instructions are not held up by it
+    with creation_lock:
+        with _lock:
+            cached = _get_valid(key)
+            if cached is not None:
+                return cached[0]  # created by another thread in the meantime
+        try:
+            cached_content = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{config.GEMINI_CONTEXT_CACHE_TTL}s",
+                )
+            )
+            name = cached_content.name
+        except Exception as e:
+            print(f"{PINK}Could not cache the instructions for `{model}`: {e}{RESET}")
+            name = None
+
+        evicted = []
+        with _lock:
+            _gemini_caches[key] = (name, time.time())
+            _gemini_caches.move_to_end(key)
+            while len(_gemini_caches) > config.GEMINI_CONTEXT_CACHE_MAX_ENTRIES:
+                old_key, (old_name, _) = _gemini_caches.popitem(last=False)
+                _creation_locks.pop(old_key, None)
+                if old_name:
+                    evicted.append(old_name)
+    for old_name in evicted:
+        _delete_gemini_cached_content(client, old_name)
+    return name
+
+
+def invalidate_gemini_cached_content(name: str):
+    """Forgets a cached content the API no longer knows (e.g. it expired early)."""
+    with _lock:
+        for key, (cached_name, _) in list(_gemini_caches.items()):
+            if cached_name == name:
+                del _gemini_caches[key]
+
+
+def _delete_gemini_cached_content(client, name: str):
+    try:
+        client.caches.delete(name=name)
+    except Exception as e:
+        print(f"{PINK}Could not delete the cached instructions `{name}`: {e}{RESET}")
+
+
+def get_gemini_request(client, prompt: str, role: str, model: str):
+    """
+    Returns (contents, generate config) for a Gemini request. The role (which carries the static instructions of
+    agents) is sent first, either as cached content or, if it can not be cached, as the start of the prompt.
+    """
+    cached_content = get_gemini_cached_content(client, model, role)
+    if cached_content is None:
+        return f"TASK: {role} \n---\nPROMPT: {prompt}", None
+    return f"PROMPT: {prompt}", types.GenerateContentConfig(cached_content=cached_content)
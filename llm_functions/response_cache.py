@@ -0,0 +1,182 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import config
+from util.colors import PINK, RESET
+
+# --- Exact tier: in-memory LRU in front of a SQLite table; semantic tier: prompt embeddings of the cached entries ---
+_memory_cache = OrderedDict()  # key -> (response, created)
+_semantic_entries = {}  # key -> (model, role hash, normalized prompt embedding)
+_lock = threading.Lock()
+_connection = None
+_puts_since_trim = 0
+
+
+def get_cache_key(prompt: str, role: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\n{get_role_hash(role)}\n{prompt}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def get_role_hash(role: str) -> str:
+    return hashlib.sha256(role.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _get_connection():
+    """Opens the on-disk store on first use. Requires the lock."""
+    global _connection
+    if _connection is None:
+        os.makedirs(os.path.dirname(config.RESPONSE_CACHE_FILE), exist_ok=True)
+        _connection = sqlite3.connect(config.RESPONSE_CACHE_FILE, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, role_hash TEXT, response TEXT, created REAL, last_used REAL, "
+            "embedding BLOB)"
+        )
+        _connection.commit()
+        if config.RESPONSE_CACHE_SEMANTIC:
+            _load_semantic_entries()
+    return _connection
+
+
+def _load_semantic_entries():
+    import numpy as np
+    rows = _connection.execute(
+        "SELECT key, model, role_hash, embedding FROM responses WHERE embedding IS NOT NULL AND created >= ?",
+        (time.time() - config.RESPONSE_CACHE_TTL,)
+    ).fetchall()
+    for key, model, role_hash, embedding in rows:
+        _semantic_entries[key] = (model, role_hash, np.frombuffer(embedding, dtype=np.float32))
+
+
+def _is_expired(created: float) -> bool:
+    return time.time() - created > config.RESPONSE_CACHE_TTL
+
+
+def _remember(key: str, response: str, created: float):
+    """Puts the response into the in-memory LRU tier. Requires the lock."""
+    _memory_cache[key] = (response, created)
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > config.RESPONSE_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def _get_prompt_embedding(prompt: str):
+    """Embedding for the semantic tier, or None if the prompt is too long to be embedded as a whole."""
+    from llm_functions.llm_util import count_context_length
+    from rag.embedding_cache import get_query_embedding
+    from rag.embedding_function import EMBEDDING_MODEL
+
+    if count_context_length(prompt, model=EMBEDDING_MODEL) > config.max_tokens[EMBEDDING_MODEL]:
+        return None
+    import numpy as np
+    embedding = get_query_embedding(prompt)
+    return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+
+def _get_exact(key: str):
+    """Requires the lock."""
+    cached = _memory_cache.get(key)
+    if cached is not None:
+        if not _is_expired(cached[1]):
+            _memory_cache.move_to_end(key)
+            return cached[0]
+        del _memory_cache[key]
+
+    connection = _get_connection()
+    row = connection.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None or _is_expired(row[1]):
+        return None
+    connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+    connection.commit()
+    _remember(key, row[0], row[1])
+    return row[0]
+
+
+def get(prompt: str, role: str, model: str):
+    """Returns the cached response of (model, role, prompt), or of a near-identical prompt, or None."""
+    key = get_cache_key(prompt, role, model)
+    try:
+        with _lock:
+            response = _get_exact(key)
+        if response is not None or not config.RESPONSE_CACHE_SEMANTIC:
+            return response
+
+        embedding = _get_prompt_embedding(prompt)
+        if embedding is None:
+            return None
+        role_hash = get_role_hash(role)
+        with _lock:
+            best_key, best_similarity = None, config.RESPONSE_CACHE_SIMILARITY
+            for entry_key, (entry_model, entry_role_hash, entry_embedding) in _semantic_entries.items():
+                if entry_model != model or entry_role_hash != role_hash:
+                    continue
+                similarity = float(entry_embedding @ embedding)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = entry_key, similarity
+            if best_key is None:
+                return None
+            response = _get_exact(best_key)
+            if response is None:
+                _semantic_entries.pop(best_key, None)  # expired
+            return response
+    except Exception as e:
+        print(f"{PINK}Response cache lookup failed: {e}{RESET}")
+        return None
+
+
+def put(prompt: str, role: str, model: str, response: str):
+    global _puts_since_trim
+    if not response or response.startswith("Error"):
+        return  # provider errors are returned as text and must not be replayed
+    key = get_cache_key(prompt, role, model)
+    try:
+        embedding = _get_prompt_embedding(prompt) if config.RESPONSE_CACHE_SEMANTIC else None
+        now = time.time()
+        with _lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO responses (key, model, role_hash, response, created, last_used, embedding) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, get_role_hash(role), response, now, now,
+                 None if embedding is None else embedding.astype("float32").tobytes())
+            )
+            connection.commit()
+            _remember(key, response, now)
+            if embedding is not None:
+                _semantic_entries[key] = (model, get_role_hash(role), embedding)
+
+            _puts_since_trim += 1
+            if _puts_since_trim >= 100:
+                _puts_since_trim = 0
+                _trim()
+    except Exception as e:
+        print(f"{PINK}Could not write to the response cache: {e}{RESET}")
+
+
+def _trim():
+    """Drops expired entries and the least recently used ones beyond RESPONSE_CACHE_DISK_SIZE. Requires the lock."""
+    connection = _get_connection()
+    connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - config.RESPONSE_CACHE_TTL,))
+    connection.execute(
+        "DELETE FROM responses WHERE key NOT IN (SELECT key FROM responses ORDER BY last_used DESC LIMIT ?)",
+        (config.RESPONSE_CACHE_DISK_SIZE,)
+    )
+    connection.commit()
+    if _semantic_entries:
+        remaining = {row[0] for row in connection.execute("SELECT key FROM responses WHERE embedding IS NOT NULL")}
+        for key in list(_semantic_entries):
+            if key not in remaining:
+                del _semantic_entries[key]
+
+
+def clear():
+    with _lock:
+        _memory_cache.clear()
+        _semantic_entries.clear()
+        connection = _get_connection()
+        connection.execute("DELETE FROM responses")
+        connection.commit()
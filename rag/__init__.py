@@ -1,3 +1,4 @@
 from .query_data import query_rag, query_rag_with_llm_response
-from .add_db_entry import add_chroma_entry
-from .embedding_function import openai_ef
\ No newline at end of file
+from .add_db_entry import add_chroma_entry, add_chroma_entries
+from .embedding_function import openai_ef
+from .vector_store import get_vector_store
\ No newline at end of file
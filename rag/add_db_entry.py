@@ -1,15 +1,17 @@
-import chromadb
-
-from rag.embedding_function import openai_ef
-from scrt import CHROMADB_HOST, CHROMADB_PORT
+from rag.hybrid_retrieval import index_entries, remove_entries
+from rag.vector_store import get_vector_store
 
 
 def add_chroma_entry(chroma_collection_name: str, content: str, id_: str, metadata: dict):
-    chroma_client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
-    collection = chroma_client.get_or_create_collection(name=chroma_collection_name,
-                                                        embedding_function=openai_ef)
-    collection.upsert(
-        documents=[content],
-        metadatas=[metadata],
-        ids=[id_]
-    )
\ No newline at end of file
+    add_chroma_entries(chroma_collection_name, [content], [id_], [metadata])
+
+
+def add_chroma_entries(chroma_collection_name: str, contents: list, ids: list, metadatas: list, embeddings: list = None):
+    """Upserts many entries in one call. Precomputed embeddings are passed through, so the store does not embed again."""
+    get_vector_store().upsert(chroma_collection_name, ids, contents, metadatas, embeddings)
+    index_entries(chroma_collection_name, ids, contents, metadatas)
+
+
+def delete_chroma_entries(chroma_collection_name: str, ids: list):
+    get_vector_store().delete(chroma_collection_name, ids)
+    remove_entries(chroma_collection_name, ids)
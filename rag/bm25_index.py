@@ -0,0 +1,150 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import util
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str):
+    """Lower-cased word tokens. Identifiers like `get_collection_size` or `KeyError` stay whole tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Inverted index with Okapi BM25 scoring, updated incrementally on every upsert.
+    Upserts are appended to `log_file` as ids with their term frequencies (the documents themselves stay in the
+    vector store). The log is replayed on load (the last entry of an id wins) and compacted if it holds superseded
+    entries. Deletions are logged as tombstones. Other processes (e.g. `rag.bulk_ingest`) append to the same log: before every search, lines appended
+    since are replayed, and the index is reloaded if the log was replaced (compacted) or removed.
+    """
+
+    def __init__(self, log_file: str, k1: float = 1.5, b: float = 0.75):
+        self.log_file = log_file
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        with self._lock:
+            self._reset()
+            self._refresh()
+            if self._log_lines > len(self.doc_lengths) or self._legacy_lines:
+                self._compact()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def _reset(self):
+        self.postings = {}  # term -> {id: term frequency}
+        self.doc_terms = {}  # id -> Counter of terms, to remove the old postings on update
+        self.doc_lengths = {}
+        self.total_length = 0
+        self._log_inode = None
+        self._log_offset = 0  # bytes of the log replayed so far
+        self._log_lines = 0
+        self._legacy_lines = 0  # lines that still carry the whole document
+
+    def _refresh(self):
+        """Replays the lines appended to the log since the last call. Requires the lock."""
+        try:
+            stat = os.stat(self.log_file)
+        except FileNotFoundError:
+            if self._log_offset:
+                self._reset()
+            return
+        if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+            self._reset()
+            self._log_inode = stat.st_ino
+        if stat.st_size == self._log_offset:
+            return
+
+        with open(self.log_file, "rb") as f:
+            f.seek(self._log_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a line another process is still writing, it is read on the next refresh
+                self._log_offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn line after a crash
+                self._log_lines += 1
+                if entry.get("deleted"):
+                    self._remove(entry["id"])
+                    continue
+                if "terms" in entry:
+                    terms = Counter(entry["terms"])
+                else:
+                    terms = Counter(tokenize(entry["document"]))
+                    self._legacy_lines += 1
+                self._index(entry["id"], terms)
+
+    def _compact(self):
+        """Atomically rewrites the log with one entry per id. Requires the lock."""
+        tmp_file = f"{self.log_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            for id_, terms in self.doc_terms.items():
+                f.write(json.dumps({"id": id_, "terms": terms}) + "\n")
+        os.replace(tmp_file, self.log_file)
+        stat = os.stat(self.log_file)
+        self._log_inode = stat.st_ino
+        self._log_offset = stat.st_size
+        self._log_lines = len(self.doc_terms)
+        self._legacy_lines = 0
+
+    def _remove(self, id_: str):
+        terms = self.doc_terms.pop(id_, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            del postings[id_]
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(id_)
+
+    def _index(self, id_: str, terms: Counter):
+        self._remove(id_)
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[id_] = frequency
+        self.doc_terms[id_] = terms
+        self.doc_lengths[id_] = sum(terms.values())
+        self.total_length += self.doc_lengths[id_]
+
+    def add(self, ids: list, documents: list):
+        self._append("".join(json.dumps({"id": id_, "terms": Counter(tokenize(document))}) + "\n"
+                             for id_, document in zip(ids, documents)))
+
+    def remove(self, ids: list):
+        self._append("".join(json.dumps({"id": id_, "deleted": True}) + "\n" for id_ in ids))
+
+    def _append(self, lines: str):
+        with self._lock:
+            util.ensure_directory_exists(os.path.dirname(self.log_file))
+            with open(self.log_file, "a", encoding="utf-8") as f:
+                f.write(lines)
+            # indexes the new entries together with whatever other processes appended in the meantime
+            self._refresh()
+
+    def search(self, query_text: str, n_results: int):
+        """Returns up to `n_results` (id, score) pairs with the highest BM25 score, best first."""
+        with self._lock:
+            self._refresh()
+            n_docs = len(self.doc_lengths)
+            if n_docs == 0:
+                return []
+            average_length = self.total_length / n_docs
+            scores = {}
+            for term in set(tokenize(query_text)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for id_, frequency in postings.items():
+                    length_norm = 1 - self.b + self.b * self.doc_lengths[id_] / average_length
+                    scores[id_] = scores.get(id_, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
@@ -0,0 +1,239 @@
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+import config
+from config import max_tokens
+from util.colors import GREEN, ORANGE, PINK, RED, RESET, WHITE
+
+from .add_db_entry import add_chroma_entries, delete_chroma_entries
+from .embedding_function import openai_ef, EMBEDDING_MODEL
+from .vector_store import get_vector_store
+
+from llm_functions import count_context_length
+
+TEXT_FILE_EXTENSIONS = (".txt", ".md", ".rst", ".py", ".html", ".htm", ".csv", ".json", ".xml")
+STALE_CHUNK_PROBE_SIZE = 1000  # chunk ids looked up per request when searching for chunks of shrunken documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert a directory of documents into a Chroma collection.")
+    parser.add_argument("source", type=str, help="Directory (searched recursively) or single file to ingest.")
+    parser.add_argument("--collection", default="python", help="Select the chroma collection.")
+    parser.add_argument("--chunk_tokens", type=int, default=config.RAG_CHUNK_SIZE, help="Maximum tokens per chunk.")
+    parser.add_argument("--batch_size", type=int, default=config.INGEST_BATCH_SIZE, help="Maximum chunks per embedding/upsert batch.")
+    parser.add_argument("--workers", type=int, default=config.INGEST_WORKERS, help="Number of batches processed in parallel.")
+    parser.add_argument("--restart", action="store_true", help="Ignore the progress of earlier runs.")
+    args = parser.parse_args()
+
+    ingest(args.source, args.collection, chunk_tokens=args.chunk_tokens, batch_size=args.batch_size,
+           workers=args.workers, restart=args.restart)
+
+
+def get_document_paths(source: str):
+    if os.path.isfile(source):
+        return [source]
+    paths = []
+    for root, _, files in os.walk(source):
+        for file in sorted(files):
+            if file.endswith(TEXT_FILE_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+    return sorted(paths)
+
+
+def split_into_chunks(text: str, chunk_tokens: int):
+    """
+    Packs paragraphs into chunks of at most `chunk_tokens` tokens of the embedding model.
+    Paragraphs that are too long on their own are split by characters.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for paragraph in text.split("\n\n"):
+        if not paragraph.strip():
+            continue
+        tokens = count_context_length(paragraph, model=EMBEDDING_MODEL)
+        if tokens > chunk_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            piece_length = max(1, int(len(paragraph) * chunk_tokens / tokens * 0.9))
+            for i in range(0, len(paragraph), piece_length):
+                chunks.append(paragraph[i:i + piece_length])
+            continue
+        separator_tokens = 1 if current else 0  # the "\n\n" joining the paragraphs
+        if current and current_tokens + separator_tokens + tokens > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens, separator_tokens = [], 0, 0
+        current.append(paragraph)
+        current_tokens += separator_tokens + tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def get_chunk_key(chunk_id: str, content: str):
+    """Identifies a chunk together with its content, so changed documents are ingested again on resume."""
+    return f"{chunk_id}:{hashlib.sha1(content.encode('utf-8', 'surrogatepass')).hexdigest()}"
+
+
+def get_progress_file(collection: str):
+    return os.path.join(config.INGEST_PROGRESS_DIR, f"{collection}.jsonl")
+
+
+def load_progress(progress_file: str):
+    done = set()
+    if not os.path.exists(progress_file):
+        return done
+    with open(progress_file, "r") as f:
+        for line in f:
+            try:
+                keys = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn last line of an interrupted run
+            if isinstance(keys, dict):
+                done.difference_update(keys["removed"])
+            else:
+                done.update(keys)
+    return done
+
+
+def get_stale_chunks(collection: str, chunk_counts: dict):
+    """
+    Returns {id: metadata} of the chunks of documents that now have fewer chunks than when they were ingested.
+    The chunks of a document are numbered without gaps, so a document only has stale chunks if the chunk right after
+    its last one exists.
+    """
+    vector_store = get_vector_store()
+    stale = {}
+    probes = dict(chunk_counts)  # document -> number of the chunk to look up next
+    while probes:
+        candidates = [f"{relative_path}:{chunk_number}" for relative_path, chunk_number in probes.items()]
+        found = {}
+        for start in range(0, len(candidates), STALE_CHUNK_PROBE_SIZE):
+            found.update(_with_retry(vector_store.get, collection, candidates[start:start + STALE_CHUNK_PROBE_SIZE]))
+        probes = {relative_path: chunk_number + 1 for relative_path, chunk_number in probes.items()
+                  if f"{relative_path}:{chunk_number}" in found}
+        stale.update({id_: metadata for id_, (_, metadata) in found.items()})
+    return stale
+
+
+def make_batches(chunks, batch_size: int):
+    """
+    Groups (id, content, metadata, tokens) chunks so that no batch exceeds `batch_size` inputs
+    or INGEST_BATCH_MAX_TOKENS tokens, the limits of one embeddings request.
+    """
+    batch, batch_tokens = [], 0
+    for chunk in chunks:
+        tokens = chunk[3]
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > config.INGEST_BATCH_MAX_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def _with_retry(func, *args):
+    for attempt in range(config.INGEST_MAX_RETRIES + 1):
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt == config.INGEST_MAX_RETRIES:
+                raise
+            delay = 2 ** attempt
+            print(f"{PINK}🔍  {type(e).__name__}: {e}. Retrying in {delay}s...{RESET}")
+            time.sleep(delay)
+
+
+def _ingest_batch(collection: str, batch):
+    ids = [chunk[0] for chunk in batch]
+    contents = [chunk[1] for chunk in batch]
+    metadatas = [chunk[2] for chunk in batch]
+    embeddings = _with_retry(openai_ef, contents)
+    _with_retry(add_chroma_entries, collection, contents, ids, metadatas, embeddings)
+
+
+def ingest(source: str, collection: str, chunk_tokens: int = config.RAG_CHUNK_SIZE,
+           batch_size: int = config.INGEST_BATCH_SIZE, workers: int = config.INGEST_WORKERS, restart: bool = False):
+    """
+    Ingests all text documents under `source` into the collection.
+    Finished batches are recorded in a progress file, so an interrupted run can be resumed by running it again.
+    """
+    chunk_tokens = min(chunk_tokens, max_tokens[EMBEDDING_MODEL])  # the input limit of the embedding model
+    progress_file = get_progress_file(collection)
+    os.makedirs(config.INGEST_PROGRESS_DIR, exist_ok=True)
+    if restart and os.path.exists(progress_file):
+        os.remove(progress_file)
+    done = load_progress(progress_file)
+
+    chunks = []
+    chunk_counts = {}
+    skipped = 0
+    for path in get_document_paths(source):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        relative_path = os.path.relpath(path, source) if os.path.isdir(source) else os.path.basename(path)
+        document_chunks = split_into_chunks(text, chunk_tokens)
+        chunk_counts[relative_path] = len(document_chunks)
+        for chunk_number, content in enumerate(document_chunks):
+            chunk_id = f"{relative_path}:{chunk_number}"
+            key = get_chunk_key(chunk_id, content)
+            if key in done:
+                skipped += 1
+                continue
+            metadata = {"url": relative_path, "chunk_number": chunk_number, "ingest_key": key}
+            chunks.append((chunk_id, content, metadata, count_context_length(content, model=EMBEDDING_MODEL)))
+
+    # chunks beyond the end of re-ingested documents would otherwise still be found by queries
+    stale = get_stale_chunks(collection, chunk_counts)
+    if stale:
+        print(f"{WHITE}🔍  Removing {len(stale)} chunks of documents that got shorter.{RESET}")
+        _with_retry(delete_chroma_entries, collection, list(stale))
+        removed_keys = [metadata["ingest_key"] for metadata in stale.values() if metadata and "ingest_key" in metadata]
+        if removed_keys:
+            with open(progress_file, "a") as progress:
+                progress.write(json.dumps({"removed": removed_keys}) + "\n")
+
+    total_tokens = sum(chunk[3] for chunk in chunks)
+    print(f"{WHITE}🔍  Ingesting {len(chunks)} chunks ({total_tokens} tokens) into `{collection}`, "
+          f"{skipped} already done.{RESET}")
+    if not chunks:
+        return
+
+    progress_lock = threading.Lock()
+    ingested_chunks, ingested_tokens, failed_batches = 0, 0, 0
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor, open(progress_file, "a") as progress:
+        futures = {executor.submit(_ingest_batch, collection, batch): batch
+                   for batch in make_batches(chunks, batch_size)}
+        for future in concurrent.futures.as_completed(futures):
+            batch = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed_batches += 1
+                print(f"{RED}🔍  Batch starting at `{batch[0][0]}` failed: {e}{RESET}")
+                continue
+            with progress_lock:
+                progress.write(json.dumps([chunk[2]["ingest_key"] for chunk in batch]) + "\n")
+                progress.flush()
+            ingested_chunks += len(batch)
+            ingested_tokens += sum(chunk[3] for chunk in batch)
+            elapsed = time.monotonic() - start
+            print(f"{ORANGE}🔍  {ingested_chunks}/{len(chunks)} chunks, "
+                  f"{ingested_chunks / elapsed:.1f} chunks/s, {ingested_tokens / elapsed:.0f} tokens/s{RESET}")
+
+    elapsed = time.monotonic() - start
+    print(f"{GREEN}🔍  Ingested {ingested_chunks} chunks ({ingested_tokens} tokens) in {elapsed:.1f}s: "
+          f"{ingested_chunks / elapsed:.1f} chunks/s, {ingested_tokens / elapsed:.0f} tokens/s.{RESET}")
+    if failed_batches:
+        print(f"{RED}🔍  {failed_batches} batches failed. Run again to resume.{RESET}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import chromadb
+import httpx
+
+import config
+from rag.embedding_function import openai_ef
+from scrt import CHROMADB_HOST, CHROMADB_PORT
+from util.colors import PINK, RESET
+
+# --- Process-wide Chroma client, collection handles and TTL-cached collection sizes ---
+_client = None
+_collections = {}
+_collection_sizes = {}  # collection name -> (size, time of count)
+_lock = threading.Lock()
+
+RECONNECT_ERRORS = (httpx.ReadError, httpx.ConnectError, httpx.RemoteProtocolError)
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            _client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
+        return _client
+
+
+def get_collection(chroma_collection_name: str):
+    collection = _collections.get(chroma_collection_name)
+    if collection is not None:
+        return collection
+    client = get_client()
+    collection = client.get_or_create_collection(name=chroma_collection_name, embedding_function=openai_ef)
+    with _lock:
+        _collections[chroma_collection_name] = collection
+    return collection
+
+
+def get_collection_size(chroma_collection_name: str) -> int:
+    """Returns the number of entries in the collection, counted at most once per CHROMA_COUNT_TTL seconds."""
+    cached = _collection_sizes.get(chroma_collection_name)
+    if cached is not None and time.monotonic() - cached[1] < config.CHROMA_COUNT_TTL:
+        return cached[0]
+    size = get_collection(chroma_collection_name).count()
+    with _lock:
+        _collection_sizes[chroma_collection_name] = (size, time.monotonic())
+    return size
+
+
+def invalidate_collection_size(chroma_collection_name: str):
+    with _lock:
+        _collection_sizes.pop(chroma_collection_name, None)
+
+
+def reset_connection():
+    """Drops the cached client and collection handles, so the next call reconnects."""
+    global _client
+    with _lock:
+        _client = None
+        _collections.clear()
+        _collection_sizes.clear()
+
+
+def call_with_reconnect(func, *args, **kwargs):
+    """
+    Calls `func`, reconnecting and retrying (up to CHROMA_MAX_RETRIES times) if the connection to Chroma broke.
+    """
+    for attempt in range(config.CHROMA_MAX_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except RECONNECT_ERRORS as e:
+            if attempt == config.CHROMA_MAX_RETRIES:
+                raise
+            print(f"{PINK}🔍  Reconnecting to Chroma after {type(e).__name__}: {e}{RESET}")
+            reset_connection()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+import util
+from rag.embedding_function import openai_ef, EMBEDDING_MODEL
+from util.colors import PINK, RESET
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def get_cache_key(text: str, model: str = EMBEDDING_MODEL) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_text(text)}".encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class DiskEmbeddingStore:
+    """
+    On-disk tier of the embedding cache: a memory-mapped float32 matrix (one row per embedding)
+    plus an append-only index file mapping cache keys to rows.
+    """
+
+    def __init__(self, cache_dir: str, max_rows: int):
+        self.cache_dir = cache_dir
+        self.max_rows = max_rows
+        self.matrix_file = os.path.join(cache_dir, "embeddings.f32")
+        self.index_file = os.path.join(cache_dir, "index.jsonl")
+        self.meta_file = os.path.join(cache_dir, "meta.json")
+
+        self.rows = {}
+        self.dimension = None
+        self.capacity = 0
+        self.matrix = None
+
+        util.ensure_directory_exists(cache_dir)
+        if os.path.exists(self.meta_file):
+            self.dimension = util.load_json(self.meta_file)["dimension"]
+            self.capacity = os.path.getsize(self.matrix_file) // (self.dimension * 4)
+            if self.capacity:
+                self.matrix = np.memmap(self.matrix_file, dtype=np.float32, mode="r+",
+                                        shape=(self.capacity, self.dimension))
+        if os.path.exists(self.index_file):
+            with open(self.index_file, "r") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line
+                    if entry["row"] < self.capacity:
+                        self.rows[entry["key"]] = entry["row"]
+
+    def get(self, key: str):
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return np.array(self.matrix[row])
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity * 2, 1024)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_file, "ab") as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self.capacity = new_capacity
+        self.matrix = np.memmap(self.matrix_file, dtype=np.float32, mode="r+",
+                                shape=(self.capacity, self.dimension))
+
+    def put(self, key: str, embedding: np.ndarray):
+        if key in self.rows or len(self.rows) >= self.max_rows:
+            return
+        if self.dimension is None:
+            self.dimension = int(embedding.shape[0])
+            util.save_json(self.meta_file, {"dimension": self.dimension, "model": EMBEDDING_MODEL})
+        if embedding.shape[0] != self.dimension:
+            return
+
+        row = len(self.rows)
+        self._ensure_capacity(row + 1)
+        self.matrix[row] = embedding
+        self.matrix.flush()
+        with open(self.index_file, "a") as f:
+            f.write(json.dumps({"key": key, "row": row}) + "\n")
+        self.rows[key] = row
+
+
+# --- In-memory LRU tier and optional disk tier ---
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+_disk_store = None
+_disk_store_loaded = False
+
+
+def _get_disk_store():
+    global _disk_store, _disk_store_loaded
+    if not _disk_store_loaded:
+        _disk_store_loaded = True
+        if config.EMBEDDING_CACHE_DIR:
+            try:
+                _disk_store = DiskEmbeddingStore(config.EMBEDDING_CACHE_DIR, config.EMBEDDING_CACHE_DISK_MAX_ROWS)
+            except Exception as e:
+                print(f"{PINK}Could not open the embedding cache in `{config.EMBEDDING_CACHE_DIR}`: {e}{RESET}")
+    return _disk_store
+
+
+def _remember(key: str, embedding: np.ndarray):
+    """Puts the embedding into the in-memory LRU tier. Requires the lock."""
+    _memory_cache[key] = embedding
+    _memory_cache.move_to_end(key)
+    if len(_memory_cache) > config.EMBEDDING_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+
+def get_query_embedding(text: str) -> np.ndarray:
+    """
+    Returns the embedding of the (whitespace-normalized) text, computing it only if neither the in-memory
+    nor the on-disk cache holds it.
+    """
+    key = get_cache_key(text)
+    with _lock:
+        embedding = _memory_cache.get(key)
+        if embedding is not None:
+            _memory_cache.move_to_end(key)
+            return embedding
+
+        disk_store = _get_disk_store()
+        if disk_store is not None:
+            embedding = disk_store.get(key)
+            if embedding is not None:
+                _remember(key, embedding)
+                return embedding
+
+    embedding = np.asarray(openai_ef([normalize_text(text)])[0], dtype=np.float32)
+
+    with _lock:
+        _remember(key, embedding)
+        if disk_store is not None:
+            try:
+                disk_store.put(key, embedding)
+            except Exception as e:
+                print(f"{PINK}Could not write to the embedding cache: {e}{RESET}")
+    return embedding
@@ -1,7 +1,9 @@
 from chromadb.utils import embedding_functions
 from scrt import OPENAI_KEY
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
 openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-        model_name="text-embedding-ada-002",
+        model_name=EMBEDDING_MODEL,
         api_key=OPENAI_KEY
     )
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import threading
+
+import config
+import util
+from util.colors import RESET, WHITE
+
+from .bm25_index import BM25Index
+from .vector_store import get_vector_store
+
+# --- One BM25 index per collection, kept next to the vector store ---
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_bm25_index(collection_name: str) -> BM25Index:
+    """
+    Returns the keyword index of the collection. A collection that already has entries in the vector store but no
+    index yet (e.g. filled before hybrid retrieval existed) is indexed from the store once.
+    """
+    with _lock:
+        index = _indexes.get(collection_name)
+        if index is None:
+            log_file = os.path.join(config.BM25_INDEX_DIR, f"{util.encode_url_str(collection_name)}.jsonl")
+            is_new = not os.path.exists(log_file)
+            index = BM25Index(log_file)
+            if is_new:
+                vector_store = get_vector_store()
+                if vector_store.count(collection_name):
+                    print(f"{WHITE}🔍  Building the keyword index of `{collection_name}`...{RESET}")
+                    for ids, documents, _ in vector_store.get_all(collection_name):
+                        index.add(ids, documents)
+            _indexes[collection_name] = index
+        return index
+
+
+def index_entries(collection_name: str, ids: list, documents: list, metadatas: list):
+    if config.RAG_HYBRID_SEARCH:
+        get_bm25_index(collection_name).add(ids, documents)
+
+
+def remove_entries(collection_name: str, ids: list):
+    if config.RAG_HYBRID_SEARCH:
+        get_bm25_index(collection_name).remove(ids)
+
+
+def fuse_results(vector_results: dict, keyword_results: list, get_entries, n_results: int) -> dict:
+    """
+    Reciprocal-rank fusion: every entry scores sum(1 / (RRF_K + rank)) over the rankings it appears in.
+    Returns the best `n_results` in the layout of a Chroma query result.
+    :param get_entries: returns {id: (document, metadata)} of ids that only the keyword search found
+    """
+    scores = {}
+    entries = {}
+    for rank, (id_, document, metadata) in enumerate(zip(vector_results["ids"][0], vector_results["documents"][0],
+                                                         vector_results["metadatas"][0])):
+        scores[id_] = scores.get(id_, 0.0) + 1 / (config.RRF_K + rank + 1)
+        entries[id_] = (document, metadata)
+    for rank, (id_, _) in enumerate(keyword_results):
+        scores[id_] = scores.get(id_, 0.0) + 1 / (config.RRF_K + rank + 1)
+
+    best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    missing = [id_ for id_ in best if id_ not in entries]
+    if missing:
+        entries.update(get_entries(missing))
+    # entries the keyword index still knows but the vector store no longer has are skipped
+    best = [id_ for id_ in best if id_ in entries]
+    return {
+        "ids": [best],
+        "documents": [[entries[id_][0] for id_ in best]],
+        "metadatas": [[entries[id_][1] for id_ in best]],
+        "scores": [[scores[id_] for id_ in best]],
+    }
+
+
+def hybrid_query(collection_name: str, query_text: str, query_embedding, n_results: int, collection_size: int) -> dict:
+    n_candidates = min(n_results * config.HYBRID_CANDIDATE_FACTOR, collection_size)
+    vector_store = get_vector_store()
+    vector_results = vector_store.query(collection_name, query_embedding, n_results=n_candidates)
+    keyword_results = get_bm25_index(collection_name).search(query_text, n_candidates)
+    return fuse_results(vector_results, keyword_results, lambda ids: vector_store.get(collection_name, ids), n_results)
@@ -0,0 +1,347 @@
+import contextlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows, where the collection is only written by one process at a time
+    fcntl = None
+
+import numpy as np
+
+import config
+import util
+from util.colors import PINK, RESET
+
+from .vector_store import VectorStore
+from .embedding_function import openai_ef, EMBEDDING_MODEL
+
+
+class LocalCollection:
+    """
+    One collection of the in-process vector store.
+    Embeddings are normalized float32 rows of a matrix memory-mapped from `embeddings.f32`, documents and metadata
+    are appended to `records.jsonl` (the last record of an id wins). A deleted row is filled with the last row, so the
+    rows stay contiguous. Other processes (e.g. `rag.bulk_ingest`) write to the same files: writes hold an exclusive
+    lock on the collection directory, and records appended since the last read are replayed before every operation.
+    Collections with at least
+    LOCAL_VECTOR_IVF_MIN_SIZE entries are searched through an inverted-file index: rows are clustered around
+    sqrt(n) k-means centroids and a query only scans the rows of its LOCAL_VECTOR_IVF_NPROBE nearest centroids.
+    Smaller collections are searched brute-force.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.matrix_file = os.path.join(directory, "embeddings.f32")
+        self.records_file = os.path.join(directory, "records.jsonl")
+        self.meta_file = os.path.join(directory, "meta.json")
+        self.lock_file = os.path.join(directory, ".lock")
+
+        self._lock = threading.Lock()
+        util.ensure_directory_exists(directory)
+        with self._lock:
+            self._reset()
+            self._refresh()
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self.ids)
+
+    def _reset(self):
+        self.ids = []  # row -> id
+        self.documents = []
+        self.metadatas = []
+        self.rows = {}  # id -> row
+        self.dimension = None
+        self.capacity = 0
+        self.matrix = None
+        self._records_inode = None
+        self._records_offset = 0  # bytes of the records replayed so far
+
+        # inverted-file index
+        self._centroids = None
+        self._lists = None  # centroid -> list of rows
+        self._assignments = None  # row -> centroid
+        self._trained_size = 0
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock of the collection across processes, held while writing."""
+        with open(self.lock_file, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _refresh(self):
+        """Replays the records appended since the last call, by this or another process. Requires the lock."""
+        try:
+            stat = os.stat(self.records_file)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != self._records_inode or stat.st_size < self._records_offset:
+            if self._records_offset:
+                self._reset()
+            self._records_inode = stat.st_ino if stat is not None else None
+
+        if self.dimension is None and os.path.exists(self.meta_file):
+            self.dimension = util.load_json(self.meta_file)["dimension"]
+        if self.dimension is not None and os.path.exists(self.matrix_file):
+            capacity = os.path.getsize(self.matrix_file) // (self.dimension * 4)
+            if capacity != self.capacity:
+                # another process grew the matrix
+                self.capacity = capacity
+                self.matrix = np.memmap(self.matrix_file, dtype=np.float32, mode="r+",
+                                        shape=(self.capacity, self.dimension)) if capacity else None
+        if stat is None or stat.st_size == self._records_offset:
+            return
+
+        with open(self.records_file, "rb") as f:
+            f.seek(self._records_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a record another process is still writing, it is read on the next refresh
+                self._records_offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn line after a crash
+                if record.get("deleted"):
+                    self._delete_row(record["id"])  # the vectors were already moved when it was deleted
+                    continue
+                row = record["row"]
+                if row >= self.capacity or row > len(self.ids):
+                    continue
+                if row == len(self.ids):
+                    self.ids.append(None)
+                    self.documents.append(None)
+                    self.metadatas.append(None)
+                self.ids[row] = record["id"]
+                self.documents[row] = record["document"]
+                self.metadatas[row] = record["metadata"]
+                self.rows[record["id"]] = row
+                self._assign_to_index(row, self.matrix[row])
+
+        # (re)train once the collection doubled, so the clusters keep up with the data
+        if len(self.ids) >= config.LOCAL_VECTOR_IVF_MIN_SIZE and len(self.ids) >= 2 * self._trained_size:
+            self._train_index()
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(rows, self.capacity * 2, 1024)
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.matrix = None
+        with open(self.matrix_file, "ab") as f:
+            f.truncate(new_capacity * self.dimension * 4)
+        self.capacity = new_capacity
+        self.matrix = np.memmap(self.matrix_file, dtype=np.float32, mode="r+",
+                                shape=(self.capacity, self.dimension))
+
+    def upsert(self, ids: list, documents: list, metadatas: list, embeddings):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock, self._file_lock():
+            # rows appended by other processes must not be overwritten
+            self._refresh()
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                util.save_json(self.meta_file, {"dimension": self.dimension, "model": EMBEDDING_MODEL})
+            if vectors.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the collection's {self.dimension}")
+
+            new_rows = {}
+            for id_ in ids:
+                if id_ not in self.rows and id_ not in new_rows:
+                    new_rows[id_] = len(self.ids) + len(new_rows)
+            self._ensure_capacity(len(self.ids) + len(new_rows))
+            with open(self.records_file, "a", encoding="utf-8") as f:
+                for id_, document, metadata, vector in zip(ids, documents, metadatas, vectors):
+                    row = self.rows.get(id_, new_rows.get(id_))
+                    self.matrix[row] = vector
+                    f.write(json.dumps({"id": id_, "row": row, "document": document, "metadata": metadata}) + "\n")
+                self.matrix.flush()
+            # applies the new records like those of any other process
+            self._refresh()
+
+    def delete(self, ids: list):
+        with self._lock, self._file_lock():
+            self._refresh()
+            with open(self.records_file, "a", encoding="utf-8") as f:
+                for id_ in ids:
+                    moved = self._delete_row(id_)
+                    if moved is not None:
+                        row, last = moved
+                        self.matrix[row] = self.matrix[last]
+                        f.write(json.dumps({"id": id_, "deleted": True}) + "\n")
+                if self.matrix is not None:
+                    self.matrix.flush()
+            # replaying the own tombstones does nothing, the rows are already removed
+            self._refresh()
+
+    def _delete_row(self, id_: str):
+        """
+        Removes the entry and moves the last row into its row. Returns (row, last row), or None if the id is unknown.
+        The caller moves the vector. Requires the lock.
+        """
+        row = self.rows.pop(id_, None)
+        if row is None:
+            return None
+        last = len(self.ids) - 1
+        if self._assignments is not None:
+            self._lists[self._assignments[row]].remove(row)
+        if row != last:
+            self.ids[row], self.documents[row], self.metadatas[row] = self.ids[last], self.documents[last], self.metadatas[last]
+            self.rows[self.ids[row]] = row
+            if self._assignments is not None:
+                centroid = self._assignments[last]
+                self._lists[centroid].remove(last)
+                self._lists[centroid].append(row)
+                self._assignments[row] = centroid
+        self.ids.pop()
+        self.documents.pop()
+        self.metadatas.pop()
+        if self._assignments is not None:
+            self._assignments.pop()
+        return row, last
+
+    # --- Inverted-file index ---
+
+    def _assign_to_index(self, row: int, vector: np.ndarray):
+        """Adds the row to the list of its nearest centroid. Requires the lock."""
+        if self._centroids is None:
+            return
+        centroid = int(np.argmax(self._centroids @ vector))
+        if row < len(self._assignments):
+            old_centroid = self._assignments[row]
+            if old_centroid == centroid:
+                return
+            self._lists[old_centroid].remove(row)
+            self._assignments[row] = centroid
+        else:
+            self._assignments.append(centroid)
+        self._lists[centroid].append(row)
+
+    def _assign_rows(self, centroids: np.ndarray, n: int, block_size: int = 8192):
+        assignments = np.empty(n, dtype=np.int64)
+        for start in range(0, n, block_size):
+            block = self.matrix[start:min(start + block_size, n)]
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+
+    def _train_index(self, iterations: int = 10):
+        """Clusters the rows with spherical k-means on a sample. Requires the lock."""
+        n = len(self.ids)
+        n_lists = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        sample = self.matrix[np.sort(rng.choice(n, size=min(n, 64 * n_lists), replace=False))]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = sample[labels == i]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[i] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        assignments = self._assign_rows(centroids, n)
+        lists = [[] for _ in range(n_lists)]
+        for row, centroid in enumerate(assignments):
+            lists[centroid].append(row)
+
+        self._centroids = centroids
+        self._lists = lists
+        self._assignments = assignments.tolist()
+        self._trained_size = n
+
+    def get_all(self, page_size: int):
+        with self._lock:
+            self._refresh()
+            ids, documents, metadatas = list(self.ids), list(self.documents), list(self.metadatas)
+        for start in range(0, len(ids), page_size):
+            yield ids[start:start + page_size], documents[start:start + page_size], metadatas[start:start + page_size]
+
+    def get(self, ids: list) -> dict:
+        with self._lock:
+            self._refresh()
+            return {id_: (self.documents[self.rows[id_]], self.metadatas[self.rows[id_]])
+                    for id_ in ids if id_ in self.rows}
+
+    # --- Search ---
+
+    def query(self, query_embedding, n_results: int) -> dict:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / max(np.linalg.norm(query), 1e-12)
+
+        with self._lock:
+            self._refresh()
+            n = len(self.ids)
+            if n == 0:
+                return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+            if self._centroids is None:
+                candidates = None
+                scores = self.matrix[:n] @ query
+            else:
+                n_probe = min(config.LOCAL_VECTOR_IVF_NPROBE, len(self._centroids))
+                probed = np.argpartition(-(self._centroids @ query), n_probe - 1)[:n_probe]
+                candidates = np.fromiter((row for i in probed for row in self._lists[i]), dtype=np.int64)
+                candidates.sort()
+                scores = self.matrix[candidates] @ query
+
+            k = min(n_results, len(scores))
+            if k == 0:
+                return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+            top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+            rows = top if candidates is None else candidates[top]
+            return {
+                "ids": [[self.ids[row] for row in rows]],
+                "documents": [[self.documents[row] for row in rows]],
+                "metadatas": [[self.metadatas[row] for row in rows]],
+                "distances": [[float(1 - scores[i]) for i in top]],  # cosine distance
+            }
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store, one `LocalCollection` per directory under LOCAL_VECTOR_STORE_DIR."""
+
+    def __init__(self, directory: str = None):
+        self.directory = directory or config.LOCAL_VECTOR_STORE_DIR
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def get_collection(self, collection_name: str) -> LocalCollection:
+        with self._lock:
+            collection = self._collections.get(collection_name)
+            if collection is None:
+                collection = LocalCollection(os.path.join(self.directory, util.encode_url_str(collection_name)))
+                self._collections[collection_name] = collection
+            return collection
+
+    def count(self, collection_name: str) -> int:
+        return len(self.get_collection(collection_name))
+
+    def upsert(self, collection_name: str, ids: list, documents: list, metadatas: list, embeddings: list = None):
+        if embeddings is None:
+            embeddings = openai_ef(documents)
+        try:
+            self.get_collection(collection_name).upsert(ids, documents, metadatas, embeddings)
+        except OSError as e:
+            print(f"{PINK}🔍  Could not write to the local vector store: {e}{RESET}")
+            raise
+
+    def query(self, collection_name: str, query_embedding, n_results: int) -> dict:
+        return self.get_collection(collection_name).query(query_embedding, n_results)
+
+    def get_all(self, collection_name: str, page_size: int = 1000):
+        return self.get_collection(collection_name).get_all(page_size)
+
+    def get(self, collection_name: str, ids: list) -> dict:
+        return self.get_collection(collection_name).get(ids)
+
+    def delete(self, collection_name: str, ids: list):
+        self.get_collection(collection_name).delete(ids)
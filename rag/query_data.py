@@ -1,14 +1,15 @@
 import argparse
 import os
 
-import httpx
-
+import config
 from config import DEBUG, max_tokens
-from scrt import CHROMADB_HOST, CHROMADB_PORT
-import chromadb
 
 from util.colors import ORANGE, RESET, WHITE, PINK, RED
-from .embedding_function import openai_ef
+from .chroma_connection import RECONNECT_ERRORS
+from .vector_store import get_vector_store
+from .hybrid_retrieval import hybrid_query
+from .embedding_cache import get_query_embedding
+from .embedding_function import EMBEDDING_MODEL
 
 from llm_functions import llm_api_wrapper, count_context_length
 
@@ -93,47 +94,36 @@ def query_rag_with_llm_response(query_text: str, chroma_collection: str, unique_
 
     return response_text, context_text, metadatas
 
-def query_rag(query_text: str, chroma_collection: str, n_results: int = 3, _retry=0):
+def query_rag(query_text: str, chroma_collection: str, n_results: int = 3):
     try:
-        # Prepare the DB.
-        chroma_client = chromadb.HttpClient(host=CHROMADB_HOST, port=CHROMADB_PORT)
-
-        # Create or get the test collection
-        collection = chroma_client.get_or_create_collection(name=chroma_collection, embedding_function=openai_ef)
-
         query_text = remove_excess_query_length(query_text)
-
-        collection_size = collection.count()
-        if collection_size == 0:
-
-            print(f"{WHITE}🔍  WARNING: The collection is empty. Please add documents before querying.{RESET}")
-            return []
-
-        elif n_results > collection_size:
-            results = collection.get(limit=n_results)
-            return results
-        else:
-            # Search the DB.
-            results = collection.query(
-                query_texts=[query_text],  # Chroma will embed this for you
-                n_results=n_results  # how many results to return
-            )
-            return results
-    except httpx.ReadError as e:
-        if _retry < 3:
-            print(f"{PINK}🔍  Retrying query due to ReadError: {e}{RESET}")
-            return query_rag(query_text, chroma_collection, n_results, _retry + 1)
-        else:
-            print(f"{RED}🔍  Failed to query after 3 retries: {e}{RESET}")
-            return f"Failed to query after 3 retries: {e}"
+        return _query_collection(query_text, chroma_collection, n_results)
+    except RECONNECT_ERRORS as e:
+        print(f"{RED}🔍  Failed to query after {config.CHROMA_MAX_RETRIES} retries: {e}{RESET}")
+        return f"Failed to query after {config.CHROMA_MAX_RETRIES} retries: {e}"
     except Exception as e:
         print(f"{RED}🔍  An error occurred: {e} \n{RESET}")
         return "Error: " + str(e)
 
+def _query_collection(query_text: str, chroma_collection: str, n_results: int):
+    vector_store = get_vector_store()
+
+    collection_size = vector_store.count(chroma_collection)
+    if collection_size == 0:
+
+        print(f"{WHITE}🔍  WARNING: The collection is empty. Please add documents before querying.{RESET}")
+        return []
+
+    # Search the DB. The agent loop repeats nearly identical queries, so the embedding is cached
+    query_embedding = get_query_embedding(query_text).tolist()
+    if config.RAG_HYBRID_SEARCH:
+        # keyword matches catch exact identifiers and error strings that embeddings miss
+        return hybrid_query(chroma_collection, query_text, query_embedding, n_results, collection_size)
+    return vector_store.query(chroma_collection, query_embedding, n_results=min(n_results, collection_size))
+
 def remove_excess_query_length(query_text):
-    embedding_model = "text-embedding-ada-002"
-    token_length = count_context_length(query_text, model=embedding_model)
-    max_token_length = max_tokens[embedding_model]
+    token_length = count_context_length(query_text, model=EMBEDDING_MODEL)
+    max_token_length = max_tokens[EMBEDDING_MODEL]
 
     if token_length > max_token_length:
         if DEBUG:
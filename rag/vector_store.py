@@ -0,0 +1,114 @@
+import threading
+
+import config
+from util.colors import RESET, WHITE
+
+from .chroma_connection import get_collection, get_collection_size, invalidate_collection_size, call_with_reconnect
+
+
+class VectorStore:
+    """
+    Interface of the stores behind `query_rag` and `add_chroma_entry`.
+    Query results use Chroma's layout: {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+    """
+
+    def count(self, collection_name: str) -> int:
+        raise NotImplementedError
+
+    def upsert(self, collection_name: str, ids: list, documents: list, metadatas: list, embeddings: list = None):
+        raise NotImplementedError
+
+    def query(self, collection_name: str, query_embedding, n_results: int) -> dict:
+        raise NotImplementedError
+
+    def get_all(self, collection_name: str, page_size: int = 1000):
+        """Yields (ids, documents, metadatas) pages of all entries of the collection."""
+        raise NotImplementedError
+
+    def get(self, collection_name: str, ids: list) -> dict:
+        """Returns {id: (document, metadata)} of the entries with the ids, missing ids are left out."""
+        raise NotImplementedError
+
+    def delete(self, collection_name: str, ids: list):
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """Remote Chroma server, see `rag.chroma_connection`."""
+
+    def count(self, collection_name: str) -> int:
+        return call_with_reconnect(get_collection_size, collection_name)
+
+    def upsert(self, collection_name: str, ids: list, documents: list, metadatas: list, embeddings: list = None):
+        call_with_reconnect(self._upsert, collection_name, ids, documents, metadatas, embeddings)
+        invalidate_collection_size(collection_name)
+
+    def query(self, collection_name: str, query_embedding, n_results: int) -> dict:
+        return call_with_reconnect(self._query, collection_name, query_embedding, n_results)
+
+    def get_all(self, collection_name: str, page_size: int = 1000):
+        offset = 0
+        while True:
+            page = call_with_reconnect(self._get_page, collection_name, offset, page_size)
+            if not page["ids"]:
+                return
+            yield page["ids"], page["documents"], page["metadatas"]
+            offset += len(page["ids"])
+
+    def get(self, collection_name: str, ids: list) -> dict:
+        result = call_with_reconnect(self._get_ids, collection_name, ids)
+        return {id_: (document, metadata)
+                for id_, document, metadata in zip(result["ids"], result["documents"], result["metadatas"])}
+
+    def delete(self, collection_name: str, ids: list):
+        call_with_reconnect(self._delete, collection_name, ids)
+        invalidate_collection_size(collection_name)
+
+    @staticmethod
+    def _get_ids(collection_name: str, ids: list):
+        return get_collection(collection_name).get(ids=ids, include=["documents", "metadatas"])
+
+    @staticmethod
+    def _delete(collection_name: str, ids: list):
+        get_collection(collection_name).delete(ids=ids)
+
+    @staticmethod
+    def _get_page(collection_name: str, offset: int, limit: int):
+        return get_collection(collection_name).get(offset=offset, limit=limit, include=["documents", "metadatas"])
+
+    @staticmethod
+    def _upsert(collection_name: str, ids: list, documents: list, metadatas: list, embeddings: list):
+        get_collection(collection_name).upsert(
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids,
+            embeddings=embeddings
+        )
+
+    @staticmethod
+    def _query(collection_name: str, query_embedding, n_results: int):
+        return get_collection(collection_name).query(
+            query_embeddings=[list(query_embedding)],
+            n_results=n_results
+        )
+
+
+_vector_store = None
+_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Returns the process-wide vector store selected by VECTOR_STORE_BACKEND ("chroma" or "local")."""
+    global _vector_store
+    with _lock:
+        if _vector_store is None:
+            if config.VECTOR_STORE_BACKEND == "chroma":
+                _vector_store = ChromaVectorStore()
+            elif config.VECTOR_STORE_BACKEND == "local":
+                from .local_vector_store import LocalVectorStore
+                _vector_store = LocalVectorStore()
+            else:
+                raise ValueError(f"Unknown vector store backend `{config.VECTOR_STORE_BACKEND}`")
+            if config.DEBUG:
+                print(f"{WHITE}🔍  Using the `{config.VECTOR_STORE_BACKEND}` vector store{RESET}")
+        return _vector_store
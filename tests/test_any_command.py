@@ -0,0 +1,37 @@
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+tools = pytest.importorskip("tools")
+from tools import query_command
+
+
+class RecordingAgentSystem:
+    def __init__(self):
+        self.context_data = {}
+
+    def get_chroma_collection_of_acting_agent(self):
+        return "python"
+
+    def convert_query_results_to_xml_schema(self, results, root_name):
+        return f"<{root_name}>{results}</{root_name}>"
+
+    def add_context_data(self, name, value, description="No description available", importance=5, always_display=False):
+        self.context_data[name] = value
+
+
+def test_queries_of_one_batch_keep_their_own_results(monkeypatch):
+    monkeypatch.setattr(query_command.rag, "query_rag",
+                        lambda query, collection, n_results: {"documents": [[f"results of {query}"]]})
+    agent = SimpleNamespace(command_instructions={"query": {"active": True}})
+    agent_system = RecordingAgentSystem()
+    commands = [ET.fromstring("<query>pandas merge</query>"), ET.fromstring("<query>numpy reshape</query>")]
+
+    responses = tools.execute_commands(commands, agent, agent_system)
+
+    assert responses == [("query", "Query executed successfully.")] * 2
+    results = list(agent_system.context_data.values())
+    assert len(results) == 2
+    assert "results of pandas merge" in results[0]
+    assert "results of numpy reshape" in results[1]
@@ -1,13 +1,78 @@
+import concurrent.futures
+import threading
 import xml.etree.ElementTree as ET
 
+import config
 from util.colors import RED, RESET
 
+# Commands that only read (documents, collections) and add their results to the context, so they can run at the
+# same time. All other commands (code, response, memory, plan, ...) change the state and run one after another.
+READ_ONLY_COMMANDS = {"query", "document"}
 
-def execute_commands(commands: list[ET], agent, agent_system) -> dict[str: str]:
-    responses = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.COMMAND_WORKERS,
+                                                              thread_name_prefix="command")
+        return _executor
+
+
+class _DeferredContext:
+    """
+    Stands in for the agent system while a read-only command runs concurrently. Context data the command adds is
+    recorded and applied afterwards in the order of the commands, so the result does not depend on which command
+    finishes first.
+    """
+
+    def __init__(self, agent_system):
+        self._agent_system = agent_system
+        self._context_data = []
+
+    def add_context_data(self, *args, **kwargs):
+        self._context_data.append((args, kwargs))
+
+    def apply(self):
+        for args, kwargs in self._context_data:
+            self._agent_system.add_context_data(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._agent_system, name)
+
+
+def _execute_read_only_commands(commands: list, agent, agent_system) -> list:
+    if len(commands) == 1:
+        return [(commands[0].tag, execute_command(commands[0], agent, agent_system))]
+    contexts = [_DeferredContext(agent_system) for _ in commands]
+    futures = [_get_executor().submit(execute_command, command, agent, context)
+               for command, context in zip(commands, contexts)]
+    responses = [(command.tag, future.result()) for command, future in zip(commands, futures)]
+    for context in contexts:
+        context.apply()
+    return responses
+
+
+def execute_commands(commands: list[ET], agent, agent_system) -> list:
+    """
+    Executes the commands and returns their (tag, response) pairs in the order of the commands.
+    Consecutive read-only commands run concurrently, a state-changing command waits for everything before it.
+    """
+    responses = []
+    read_only_commands = []
     for command in commands:
-        response = execute_command(command, agent, agent_system)
-        responses[command.tag] =  response
+        if command.tag in READ_ONLY_COMMANDS:
+            read_only_commands.append(command)
+            continue
+        if read_only_commands:
+            responses.extend(_execute_read_only_commands(read_only_commands, agent, agent_system))
+            read_only_commands = []
+        responses.append((command.tag, execute_command(command, agent, agent_system)))
+    if read_only_commands:
+        responses.extend(_execute_read_only_commands(read_only_commands, agent, agent_system))
 
     return responses
 
@@ -28,6 +28,8 @@ def execute_query_command(command: ET, agent_system) -> str:
         response_text += f"Please reference the source in your answer.\n"
 
 
-    agent_system.add_context_data(f"{query_type.capitalize()} Query Results", response_text, "Query results", importance=3)
+    # keyed by the query, so several queries of one response (run concurrently) do not overwrite each other
+    agent_system.add_context_data(f"{query_type.capitalize()} Query Results for `{query}`", response_text,
+                                  "Query results", importance=3)
 
     return "Query executed successfully."
\ No newline at end of file
@@ -0,0 +1,41 @@
+import asyncio
+import concurrent.futures
+import threading
+
+import config
+
+# --- The single event loop driving all asyncio agent sessions of this process ---
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _run_loop(loop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """Returns the agent runtime's event loop, starting it in a background thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            # blocking libraries (Chroma, Docker, tokenizers) are offloaded to this bounded executor
+            _loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+                max_workers=config.ASYNC_RUNTIME_MAX_BLOCKING_WORKERS,
+                thread_name_prefix="agent-runtime-blocking"
+            ))
+            threading.Thread(target=_run_loop, args=(_loop,), name="agent-runtime", daemon=True).start()
+        return _loop
+
+
+def submit(coroutine) -> concurrent.futures.Future:
+    """Schedules the coroutine on the agent runtime's event loop and returns a future for its result."""
+    future = asyncio.run_coroutine_threadsafe(coroutine, get_loop())
+    future.add_done_callback(_log_exception)
+    return future
+
+
+def _log_exception(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error in agent runtime task: {future.exception()}")
@@ -0,0 +1,66 @@
+import os
+import threading
+
+
+class DirectoryListing:
+    """
+    Keeps the list of files below some subdirectories of `root` up to date without walking the tree on every call.
+    A directory's mtime changes whenever an entry is added, removed or renamed in it, so each call only stats the
+    known directories and lists the ones whose mtime changed.
+    Entries named in `exclude` (e.g. internal directories) are left out at any depth.
+    """
+
+    def __init__(self, root: str, subdirectories: list, exclude: tuple = ()):
+        self.root = root
+        self.subdirectories = subdirectories
+        self.exclude = set(exclude)
+        self._directories = {}  # absolute path -> (mtime in ns, file names, subdirectory paths)
+        self._lock = threading.Lock()
+
+    def _scan(self, directory: str, mtime: int):
+        files, subdirectories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name in self.exclude:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+                    else:
+                        files.append(entry.name)
+        except OSError:
+            return None
+        return mtime, sorted(files), sorted(subdirectories)
+
+    def _refresh(self, directory: str, seen: set):
+        """Rescans the directory if it changed, then its subdirectories. Requires the lock."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return
+        cached = self._directories.get(directory)
+        if cached is None or cached[0] != mtime:
+            cached = self._scan(directory, mtime)
+            if cached is None:
+                return
+            self._directories[directory] = cached
+        seen.add(directory)
+        for subdirectory in cached[2]:
+            self._refresh(subdirectory, seen)
+
+    def get_files(self) -> list:
+        """Returns the paths (relative to `root`, with forward slashes) of all files below the subdirectories."""
+        with self._lock:
+            seen = set()
+            for subdirectory in self.subdirectories:
+                self._refresh(os.path.join(self.root, subdirectory), seen)
+            # forget deleted directories
+            for directory in list(self._directories):
+                if directory not in seen:
+                    del self._directories[directory]
+
+            paths = []
+            for directory in sorted(seen):
+                relative_directory = os.path.relpath(directory, self.root).replace("\\", "/")
+                paths.extend(f"{relative_directory}/{file}" for file in self._directories[directory][1])
+            return paths
@@ -0,0 +1,160 @@
+import concurrent.futures
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from util.colors import RED, RESET
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, agent_system_name: str, func, args: tuple):
+        self.job_id = uuid.uuid4().hex
+        self.agent_system_name = agent_system_name
+        self.func = func
+        self.args = args
+        self.status = QUEUED
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "agent_system": self.agent_system_name,
+            "status": self.status,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class JobScheduler:
+    """
+    Runs jobs on a bounded pool of worker threads.
+    Jobs of the same agent system run one after another in FIFO order (an agent system's state is not
+    thread-safe), jobs of different agent systems run concurrently. At most `max_queue_depth` jobs may
+    wait at a time, further submissions are rejected with `JobQueueFull`.
+    A job function may return a `concurrent.futures.Future` (e.g. of a coroutine on the agent runtime's event loop),
+    then the worker is freed right away and the job finishes, freeing its agent system, once the future is done.
+    """
+
+    def __init__(self, max_workers: int, max_queue_depth: int, history_size: int = 1000):
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.history_size = history_size
+
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()  # agent system name -> deque of queued jobs
+        self._running_systems = set()
+        self._queued_count = 0
+        self._jobs = OrderedDict()  # job id -> job, including finished jobs up to `history_size`
+        self._workers = []
+
+    def _start_workers(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"job-worker-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def submit(self, agent_system_name: str, func, *args) -> Job:
+        with self._condition:
+            if self._queued_count >= self.max_queue_depth:
+                raise JobQueueFull(f"Job queue is full ({self.max_queue_depth} jobs waiting)")
+            job = Job(agent_system_name, func, args)
+            self._pending.setdefault(agent_system_name, deque()).append(job)
+            self._queued_count += 1
+            self._jobs[job.job_id] = job
+            self._trim_history()
+            self._start_workers()
+            self._condition.notify()
+        return job
+
+    def get(self, job_id: str):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def get_jobs_of_agent_system(self, agent_system_name: str):
+        with self._condition:
+            return [job for job in self._jobs.values() if job.agent_system_name == agent_system_name]
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancels a queued job. Running or finished jobs can not be cancelled."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return False
+            self._pending[job.agent_system_name].remove(job)
+            self._queued_count -= 1
+            job.status = CANCELLED
+            job.finished = time.time()
+            return True
+
+    def _next_job(self):
+        """Returns the oldest queued job of an agent system that is not busy, or None. Requires the lock."""
+        for agent_system_name, jobs in self._pending.items():
+            if jobs and agent_system_name not in self._running_systems:
+                job = jobs.popleft()
+                # move the system to the back, so busy systems do not starve the others
+                self._pending.move_to_end(agent_system_name)
+                return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._next_job()
+                while job is None:
+                    self._condition.wait()
+                    job = self._next_job()
+                self._queued_count -= 1
+                self._running_systems.add(job.agent_system_name)
+                job.status = RUNNING
+                job.started = time.time()
+
+            try:
+                result = job.func(*job.args)
+            except Exception as e:
+                self._finish(job, e)
+                continue
+            if isinstance(result, concurrent.futures.Future):
+                result.add_done_callback(lambda future, job=job: self._finish(
+                    job, None if future.cancelled() else future.exception()))
+            else:
+                self._finish(job, None)
+
+    def _finish(self, job: Job, error):
+        if error is None:
+            job.status = DONE
+        else:
+            print(f"{RED}Job {job.job_id} of `{job.agent_system_name}` failed: {error}{RESET}")
+            job.status = FAILED
+            job.error = str(error)
+        job.finished = time.time()
+        with self._condition:
+            self._running_systems.discard(job.agent_system_name)
+            self._condition.notify_all()
+
+    def _trim_history(self):
+        """Forgets the oldest finished jobs beyond `history_size`. Requires the lock."""
+        excess = len(self._jobs) - self.history_size
+        if excess <= 0:
+            return
+        for job_id in list(self._jobs.keys()):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].status in (DONE, FAILED, CANCELLED):
+                del self._jobs[job_id]
+                excess -= 1